@@ -0,0 +1,286 @@
+# Keeps the expensive stages of analyses on disk, so analyzing the same
+# recordings again (tuning thresholds, re-opening archives, repeating batch
+# jobs) doesn't redo them. Two kinds of entry are kept:
+#
+#   words     the recognizer's words for a recording, keyed by a hash of its
+#             samples, the target word and the grammar it was recognized with
+#   features  the band energy track, intensity track and pulse times of an
+#             isolated word, keyed by a hash of the word's samples
+#
+# Each key also holds a fingerprint of the code and parameters that produce
+# the entry, so changing them leaves old entries unused rather than wrong.
+# The detectors and their thresholds are not fingerprinted: they run again on
+# the cached tracks every time, so tuning them reuses everything expensive.
+#
+#   cache = analysisCache.AnalysisCache("analysisCache", maxBytes=256 * 1024 * 1024)
+#   result = isolateSound.findAndAnalyze(filename, target, logger, analysisCache=cache)
+#   print(analysisCache.describeStats(cache.stats()))
+#
+# Entries are files under the cache directory, each written to a temporary
+# file and renamed into place, so several processes can share the directory.
+# Reading an entry touches its file; once the entries add up to more than
+# maxBytes, the least recently used are deleted.
+
+import hashlib
+import inspect
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy
+import parselmouth
+
+import isolateSound
+import recognition
+import tracks
+
+CACHE_VERSION = 1 # Bump when the layout of the entries changes
+CACHE_DIRECTORY = "analysisCache" # Used when no directory is given
+CACHE_MAX_BYTES = 512 * 1024 * 1024 # Size the entries are kept under by default
+EVICT_FRACTION = 0.9 # Eviction deletes entries until they fit in this much of maxBytes
+RESCAN_WRITES = 200 # Writes after which the directory is scanned again for other processes' entries
+ENTRY_EXTENSIONS = {"words": ".json", "features": ".npz"}
+STAT_NAMES = ["wordsHits", "wordsMisses", "featuresHits", "featuresMisses", "evicted"]
+TRACK_TYPES = {"SpectralTrack": tracks.SpectralTrack, "IntensityTrack": tracks.IntensityTrack}
+
+# Hash of str() of each part, separated so parts can't run into each other.
+def hashParts(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+# Hash of 16 bit samples and the rate they were recorded at.
+def hashSamples(samples, framerate):
+    digest = hashlib.sha256(numpy.ascontiguousarray(samples, dtype=numpy.int16).data)
+    digest.update(str(framerate).encode("utf-8"))
+    return digest.hexdigest()
+
+# Fingerprint of the code and parameters that produce the features of a
+# word.
+def getFeaturesFingerprint():
+    functions = [isolateSound.toSound, isolateSound.getSpectralPowerList, isolateSound.getSpectralTimes,
+        isolateSound.getNearestFrames, isolateSound.getBandEnergies, isolateSound.getIntensityTrack,
+        isolateSound.getPitch, isolateSound.getPulseTimes]
+
+    return hashParts(CACHE_VERSION, parselmouth.__version__, parselmouth.PRAAT_VERSION,
+        isolateSound.SPECTRAL_TIME_STEP, isolateSound.INTENSITY_TIME_STEP,
+        *[inspect.getsource(function) for function in functions], inspect.getsource(tracks))
+
+# Fingerprint of the recognizer, which depends on the model it loads.
+def getWordsFingerprint(modelPath):
+    return hashParts(CACHE_VERSION, os.path.abspath(modelPath), inspect.getsource(recognition))
+
+# Features loaded from the cache for one word, as the dict analyzeWord fills
+# in, remembering which of them were stored so only new ones are written.
+class CachedFeatures(dict):
+    def __init__(self, features, key):
+        super().__init__(features)
+        self.key = key
+        self.storedNames = set(features)
+
+class AnalysisCache:
+    def __init__(self, directory=CACHE_DIRECTORY, maxBytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+        self.featuresFingerprint = getFeaturesFingerprint()
+        self.wordsFingerprints = {} # Fingerprint for each model path used
+
+        self.entries = None # Path of each entry: [last used, size in bytes], scanned on first write
+        self.totalBytes = 0 # Size of the entries in entries
+        self.writes = 0 # Writes since the directory was last scanned
+        self.counts = dict.fromkeys(STAT_NAMES, 0)
+        self.lock = threading.Lock() # Guards entries, totalBytes, writes and counts
+
+    def getWordsKey(self, samples, framerate, target, grammar):
+        modelPath = recognition.MODEL_REGISTRY.modelPath
+        if modelPath not in self.wordsFingerprints:
+            self.wordsFingerprints[modelPath] = getWordsFingerprint(modelPath)
+        return hashParts(hashSamples(samples, framerate), target.lower(), grammar, self.wordsFingerprints[modelPath])
+
+    # Return the words recognized in samples before, or None.
+    def getWords(self, samples, framerate, target, grammar=None):
+        data = self.read("words", self.getWordsKey(samples, framerate, target, grammar))
+        if data != None:
+            try:
+                return json.loads(data)
+            except ValueError:
+                pass
+        return None
+
+    def putWords(self, samples, framerate, target, grammar, words):
+        data = json.dumps(words, ensure_ascii=False, default=float).encode("utf-8")
+        self.write("words", self.getWordsKey(samples, framerate, target, grammar), data)
+
+    # Return a CachedFeatures of the tracks computed before for a word's
+    # samples, which is empty if there are none, for analyzeWord to use as
+    # its cache.
+    def getFeatures(self, samples, framerate):
+        key = hashParts(hashSamples(samples, framerate), self.featuresFingerprint)
+
+        data = self.read("features", key)
+        features = {}
+        if data != None:
+            try:
+                features = unpackFeatures(data)
+            except Exception:
+                features = {}
+        return CachedFeatures(features, key)
+
+    # Store the features in a CachedFeatures if any were added since it was
+    # loaded. Entries that can't be stored, such as Praat objects, are left out.
+    def putFeatures(self, features):
+        names = {name for name in features if isStorable(features[name])}
+        if names <= features.storedNames:
+            return
+
+        self.write("features", features.key, packFeatures({name: features[name] for name in names}))
+        features.storedNames = names
+
+    def getPath(self, kind, key):
+        return os.path.join(self.directory, kind, key[:2], key + ENTRY_EXTENSIONS[kind])
+
+    # Return the bytes of an entry, or None if there isn't one.
+    def read(self, kind, key):
+        path = self.getPath(kind, key)
+        try:
+            with open(path, "rb") as entry:
+                data = entry.read()
+        except OSError:
+            data = None
+
+        if data != None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        with self.lock:
+            self.counts[kind + ("Hits" if data != None else "Misses")] += 1
+            if data != None and self.entries != None and path in self.entries:
+                self.entries[path][0] = time.time()
+        return data
+
+    def write(self, kind, key, data):
+        path = self.getPath(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        handle, temporaryPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as entry:
+                entry.write(data)
+            os.replace(temporaryPath, path)
+        except OSError:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            return
+
+        with self.lock:
+            if self.entries == None or self.writes >= RESCAN_WRITES:
+                self.scan()
+            else:
+                if path in self.entries:
+                    self.totalBytes -= self.entries[path][1]
+                self.entries[path] = [os.path.getmtime(path), len(data)]
+                self.totalBytes += len(data)
+            self.writes += 1
+
+            if self.totalBytes > self.maxBytes:
+                self.evict()
+
+    # Read the last use and size of every entry from the directory, including
+    # those written by other processes. Called with lock held.
+    def scan(self):
+        self.entries = {}
+        self.totalBytes = 0
+        self.writes = 0
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                self.entries[path] = [status.st_mtime, status.st_size]
+                self.totalBytes += status.st_size
+
+    # Delete the least recently used entries until they fit well within
+    # maxBytes. Entries another process deleted first are skipped. Called
+    # with lock held.
+    def evict(self):
+        self.scan()
+        for path, (lastUsed, size) in sorted(self.entries.items(), key=lambda entry: entry[1][0]):
+            if self.totalBytes <= EVICT_FRACTION * self.maxBytes:
+                break
+            try:
+                os.remove(path)
+                self.counts["evicted"] += 1
+            except OSError:
+                pass
+            del self.entries[path]
+            self.totalBytes -= size
+
+    # Hits and misses of each kind of entry, and entries evicted, since the
+    # cache was created or the stats were last taken.
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def takeStats(self):
+        with self.lock:
+            counts = self.counts
+            self.counts = dict.fromkeys(STAT_NAMES, 0)
+        return counts
+
+# Add the counts of stats to total, both dicts as returned by stats().
+def addStats(total, stats):
+    for name in STAT_NAMES:
+        total[name] = total.get(name, 0) + stats.get(name, 0)
+    return total
+
+def describeStats(stats):
+    return (f"words {stats['wordsHits']} hits, {stats['wordsMisses']} misses; "
+        + f"features {stats['featuresHits']} hits, {stats['featuresMisses']} misses; "
+        + f"{stats['evicted']} evicted")
+
+def isStorable(value):
+    return isinstance(value, (tracks.SpectralTrack, tracks.IntensityTrack, numpy.ndarray))
+
+# Store tracks and arrays of features in a .npz file, each track as its
+# values, times and step.
+def packFeatures(features):
+    arrays = {}
+    for name, value in features.items():
+        if isinstance(value, tracks.Track):
+            arrays[name + ".values"] = value.values
+            arrays[name + ".times"] = value.times
+            arrays[name + ".step"] = numpy.array(numpy.nan if value.step == None else value.step)
+            arrays[name + ".type"] = numpy.array(type(value).__name__)
+        elif isinstance(value, numpy.ndarray):
+            arrays[name] = value
+
+    output = io.BytesIO()
+    numpy.savez(output, **arrays)
+    return output.getvalue()
+
+def unpackFeatures(data):
+    features = {}
+    with numpy.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        for name in arrays.files:
+            if name.endswith((".times", ".step", ".type")):
+                continue
+            if name.endswith(".values"):
+                name = name[:-len(".values")]
+                step = float(arrays[name + ".step"])
+                trackType = TRACK_TYPES[str(arrays[name + ".type"])]
+                features[name] = trackType(arrays[name + ".values"], arrays[name + ".times"], None if numpy.isnan(step) else step)
+            else:
+                features[name] = arrays[name]
+    return features
@@ -0,0 +1,129 @@
+# Runs the analysis of recorded takes on a few background threads, so the
+# recording thread is free as soon as recording stops and re-recording
+# quickly doesn't pile up analyses competing for the CPU. Jobs are grouped,
+# one group per feedback label: a new job cancels the unfinished job of its
+# group, whose feedback would be stale by the time it was shown.
+
+import queue
+import threading
+import traceback
+
+import uiThread
+
+ANALYSIS_WORKERS = 2 # Analyses that may run at once
+
+# One queued analysis. function is called as function(job, *args) and should
+# pass job.cancelled on to the analysis, which stops early once it is set. It
+# is called even if the job was cancelled while queued, so it can release
+# what it holds.
+class AnalysisJob:
+    def __init__(self, group, function, args, onDone):
+        self.group = group
+        self.function = function
+        self.args = args
+        self.onDone = onDone # Called as onDone(job, result), unless the job was cancelled
+
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def isCancelled(self):
+        return self.cancelled.is_set()
+
+class AnalysisPool:
+    def __init__(self, workers=ANALYSIS_WORKERS):
+        self.workers = workers
+        self.threads = [] # Started on the first submit
+
+        self.jobs = queue.Queue() # Jobs waiting for a thread, and None to stop a thread
+        self.current = {} # Newest unfinished job of each group
+        self.unfinished = 0 # Jobs submitted and not yet finished or given up
+        self.idleCallbacks = [] # Called once unfinished drops to 0
+        self.lock = threading.Lock() # Guards current, unfinished, idleCallbacks and threads
+
+    # Queue function(job, *args) to run in the background as the newest job
+    # of group, cancelling the one it supersedes. Returns the job.
+    def submit(self, group, function, *args, onDone=None):
+        job = AnalysisJob(group, function, args, onDone)
+
+        with self.lock:
+            if len(self.threads) == 0:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self.runJobs, daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+
+            previous = self.current.get(group)
+            if previous != None:
+                previous.cancel()
+            self.current[group] = job
+            self.unfinished += 1
+
+        self.jobs.put(job)
+        return job
+
+    # Cancel the unfinished job of group, if there is one.
+    def cancel(self, group):
+        with self.lock:
+            job = self.current.pop(group, None)
+        if job != None:
+            job.cancel()
+
+    def runJobs(self):
+        job = self.jobs.get()
+        while job != None:
+            try:
+                result = job.function(job, *job.args)
+                if not job.isCancelled() and job.onDone != None:
+                    job.onDone(job, result)
+            except Exception:
+                traceback.print_exc()
+
+            with self.lock:
+                if self.current.get(job.group) is job:
+                    del self.current[job.group]
+
+                self.unfinished -= 1
+                idleCallbacks = []
+                if self.unfinished == 0:
+                    idleCallbacks = self.idleCallbacks
+                    self.idleCallbacks = []
+
+            for callback in idleCallbacks:
+                callback()
+
+            job = self.jobs.get()
+
+    # Call callback once every job submitted so far has finished or given up:
+    # straight away if none are unfinished, otherwise on the thread that
+    # finishes the last one.
+    def whenIdle(self, callback):
+        with self.lock:
+            if self.unfinished > 0:
+                self.idleCallbacks.append(callback)
+                return
+        callback()
+
+    # Stop the threads once the jobs already queued are done.
+    def shutdown(self):
+        with self.lock:
+            threads = self.threads
+            self.threads = []
+
+        for _ in threads:
+            self.jobs.put(None)
+        for thread in threads:
+            thread.join()
+
+ANALYSIS_POOL = AnalysisPool()
+
+# Show text in label once an analysis is done, from whichever thread it
+# finished on, unless job has been cancelled by the time the Tk main loop
+# gets to it.
+def postFeedback(label, text, job=None):
+    uiThread.UI.call(showFeedback, label, text, job)
+
+def showFeedback(label, text, job):
+    if job == None or not job.isCancelled():
+        label.config(text=text)
@@ -0,0 +1,224 @@
+# Owns the sound device for the whole study. One PyAudio instance is created
+# for the life of the program, and its input and output streams are opened
+# once and only started and stopped for each take or playback, so a take
+# starts capturing straight away instead of after the device is set up.
+# Recording and playback take turns on the device.
+#
+# Input is captured in callback mode: PortAudio hands each buffer to
+# captureAudio() on its own thread, which stores it in the take's
+# CaptureBuffer, so a slow reader can't make the device overflow.
+
+import queue
+import threading
+import time
+
+import numpy
+import pyaudio
+
+AUDIO_FORMAT = pyaudio.paInt16
+AUDIO_CHANNELS = 1
+AUDIO_RATE = 44100
+AUDIO_BUF_FRAMES = 1024
+SAMPLE_BYTES = 2 # Bytes in one 16 bit mono frame
+CAPTURE_SECONDS = 20 # Audio a CaptureBuffer has room for before it must grow
+
+# Audio captured during one take, kept in a single block of memory that is
+# allocated up front and grown by doubling if the take runs long. Each chunk
+# is also queued for the thread consuming the take as it is captured.
+class CaptureBuffer:
+    def __init__(self, rate=AUDIO_RATE, seconds=CAPTURE_SECONDS):
+        self.rate = rate
+        self.data = bytearray(int(rate * seconds) * SAMPLE_BYTES)
+        self.length = 0 # Bytes of data captured so far
+
+        self.chunks = queue.Queue() # Captured chunks not yet consumed, then None once capture stops
+        self.overflows = 0 # Buffers in which the device dropped input
+
+    # Store a chunk of captured audio. Ran on the audio callback thread.
+    def append(self, chunk):
+        end = self.length + len(chunk)
+        if end > len(self.data):
+            # A new block rather than resizing, so views of the old one stay valid
+            grown = bytearray(max(end, 2 * len(self.data)))
+            grown[:self.length] = memoryview(self.data)[:self.length]
+            self.data = grown
+
+        self.data[self.length:end] = chunk
+        self.length = end
+        self.chunks.put(chunk)
+
+    def finish(self):
+        self.chunks.put(None)
+
+    # Return the next captured chunk, b"" if none arrived within timeout
+    # seconds, or None once capture has stopped and every chunk was returned.
+    def nextChunk(self, timeout=None):
+        try:
+            return self.chunks.get(timeout=timeout)
+        except queue.Empty:
+            return b""
+
+    # The samples captured so far as an array that shares the buffer's memory
+    # rather than copying it.
+    def samples(self):
+        return numpy.frombuffer(self.data, dtype=numpy.int16, count=self.length // SAMPLE_BYTES)
+
+class AudioEngine:
+    def __init__(self, rate=AUDIO_RATE, channels=AUDIO_CHANNELS, format=AUDIO_FORMAT, framesPerBuffer=AUDIO_BUF_FRAMES):
+        self.rate = rate
+        self.channels = channels
+        self.format = format
+        self.framesPerBuffer = framesPerBuffer
+
+        self.audio = None # Shared pyaudio.PyAudio, created on first use
+        self.inputStream = None # Opened once, stopped between takes
+        self.outputStream = None # Opened once, stopped between playbacks
+        self.openLock = threading.Lock() # Guards creating audio and opening the streams
+        self.deviceLock = threading.Lock() # Held by the take or playback using the device
+
+        self.capture = None # CaptureBuffer of the take being captured
+        self.startTime = None # perf_counter() when the running stream was started, until its first frame
+        self.inputLatencies = [] # Seconds from starting each take to its first captured frame
+        self.outputLatencies = [] # Seconds from starting each playback to its first frame being taken
+
+        self.warmThread = None
+
+    def getAudio(self):
+        if self.audio == None:
+            self.audio = pyaudio.PyAudio()
+        return self.audio
+
+    def getInputStream(self):
+        with self.openLock:
+            if self.inputStream == None:
+                self.inputStream = self.getAudio().open(format=self.format, channels=self.channels, rate=self.rate,
+                    input=True, frames_per_buffer=self.framesPerBuffer, start=False, stream_callback=self.captureAudio)
+            return self.inputStream
+
+    def getOutputStream(self):
+        with self.openLock:
+            if self.outputStream == None:
+                self.outputStream = self.getAudio().open(format=self.format, channels=self.channels, rate=self.rate,
+                    output=True, frames_per_buffer=self.framesPerBuffer, start=False)
+            return self.outputStream
+
+    # Open the device and both streams on a background thread, so the first
+    # take doesn't wait for them. A stream that fails to open here is opened
+    # again by the first take or playback, which raises its error.
+    def warm(self):
+        if self.warmThread == None:
+            self.warmThread = threading.Thread(target=self.warmStreams, daemon=True)
+            self.warmThread.start()
+        return self.warmThread
+
+    def warmStreams(self):
+        try:
+            self.getInputStream()
+            self.getOutputStream()
+        except Exception:
+            pass
+
+    # Take the device and start capturing into capture, a CaptureBuffer.
+    # Waits for any playback to finish first. Must be paired with
+    # stopInput(capture).
+    def startInput(self, capture):
+        self.deviceLock.acquire()
+        try:
+            stream = self.getInputStream()
+            self.capture = capture
+            self.startTime = time.perf_counter()
+            stream.start_stream()
+        except:
+            self.capture = None
+            self.deviceLock.release()
+            raise
+
+    # Called by PortAudio on its own thread with each buffer of input.
+    def captureAudio(self, data, frameCount, timeInfo, status):
+        capture = self.capture
+        if capture != None:
+            if self.startTime != None:
+                self.inputLatencies.append(time.perf_counter() - self.startTime)
+                self.startTime = None
+            if status & pyaudio.paInputOverflow:
+                capture.overflows += 1
+            capture.append(data)
+        return (None, pyaudio.paContinue)
+
+    # Stop capturing into capture, mark the end of its chunks and let
+    # playback have the device. The stream stays open for the next take.
+    # Does nothing if capture isn't being captured into.
+    def stopInput(self, capture):
+        if self.capture is not capture:
+            return
+
+        try:
+            self.inputStream.stop_stream()
+        finally:
+            self.capture = None
+            self.startTime = None
+            capture.finish()
+            self.deviceLock.release()
+
+    # Take the device and start playing. Waits for any take or other
+    # playback to finish first. Must be paired with stopOutput().
+    def startOutput(self):
+        self.deviceLock.acquire()
+        try:
+            stream = self.getOutputStream()
+            self.startTime = time.perf_counter()
+            stream.start_stream()
+        except:
+            self.deviceLock.release()
+            raise
+
+    def writeOutput(self, data):
+        self.outputStream.write(data)
+        if self.startTime != None:
+            self.outputLatencies.append(time.perf_counter() - self.startTime)
+            self.startTime = None
+
+    # Wait for the audio written so far to play, then let go of the device.
+    def stopOutput(self):
+        try:
+            self.outputStream.stop_stream()
+        finally:
+            self.startTime = None
+            self.deviceLock.release()
+
+    # Seconds from starting the last take to its first frame, or None.
+    def lastInputLatency(self):
+        if len(self.inputLatencies) == 0:
+            return None
+        return self.inputLatencies[-1]
+
+    def stats(self):
+        return {
+            "takes": len(self.inputLatencies),
+            "meanInputLatency": sum(self.inputLatencies) / len(self.inputLatencies) if len(self.inputLatencies) > 0 else None,
+            "playbacks": len(self.outputLatencies),
+            "meanOutputLatency": sum(self.outputLatencies) / len(self.outputLatencies) if len(self.outputLatencies) > 0 else None,
+        }
+
+    # Close the streams and release the device. Ran once, at exit. A take or
+    # playback still running after timeout seconds is left to the exiting
+    # process rather than closed under it.
+    def close(self, timeout=2):
+        if not self.deviceLock.acquire(timeout=timeout):
+            return
+
+        try:
+            with self.openLock:
+                for stream in (self.inputStream, self.outputStream):
+                    if stream != None:
+                        stream.close()
+                self.inputStream = None
+                self.outputStream = None
+
+                if self.audio != None:
+                    self.audio.terminate()
+                    self.audio = None
+        finally:
+            self.deviceLock.release()
+
+AUDIO_ENGINE = AudioEngine()
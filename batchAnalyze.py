@@ -0,0 +1,258 @@
+# Analyze recordings without the study window, e.g. to re-score collected
+# recordings after tuning thresholds. Recordings are spread across a pool of
+# processes, each loading the speech model once, and each result is written
+# out as soon as its recording is done. Participants' zip archives can be
+# given directly; their recordings are read without extracting them. Once
+# the native speaker references are indexed (see referenceIndex), each
+# result's measurements include how it differs from them. With
+# --cache, recognized words and feature tracks are kept on disk (see
+# analysisCache) so running again after changing a threshold is quick.
+#
+#   python batchAnalyze.py recordings/ "more/*.wav" archives/*.zip -o results.jsonl --workers 4 --cache analysisCache
+
+import argparse
+import concurrent.futures
+import csv
+import glob
+import json
+import os
+import sys
+import time
+import zipfile
+
+import analysisCache
+import instrumentation
+import isolateSound
+import measurementLog
+import recognition
+import referenceIndex
+import sentences
+import studyArchive
+
+RESULT_FIELDS = ["file", "member", "target", "word", "result", "measurements", "seconds", "log"]
+
+WORKER_SPANS = [] # Spans recorded in this worker for the recording being analyzed
+WORKER_CACHE = None # This worker's analysisCache.AnalysisCache, with --cache
+
+# Expand directories (every .wav and .zip inside), glob patterns and file
+# names into a sorted list of wave files and archives.
+def findRecordings(inputs):
+    recordings = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            recordings.update(glob.glob(os.path.join(pattern, "*.wav")))
+            recordings.update(glob.glob(os.path.join(pattern, "*.zip")))
+        else:
+            recordings.update(glob.glob(pattern))
+    return sorted(recordings)
+
+# Read "file,word" lines giving the target word of each recording.
+def readTargets(filename):
+    targets = {}
+    with open(filename, newline='') as targetFile:
+        for row in csv.reader(targetFile):
+            if len(row) >= 2:
+                targets[os.path.normpath(row[0])] = row[1].strip()
+    return targets
+
+# Runs once in each worker process. With loadModel, the model is loaded
+# here so recognition doesn't pay for it on the first recording; main has
+# already loaded it once, so a worker that can't load it stops the run
+# rather than classifying every recording as OTHER. With trace, the spans of
+# each analysis are collected and sent back with its result. With
+# cacheDirectory, analyses share a cache there of at most cacheBytes.
+def startWorker(modelPath, loadModel, trace=False, cacheDirectory=None, cacheBytes=analysisCache.CACHE_MAX_BYTES):
+    global WORKER_CACHE
+
+    if trace:
+        instrumentation.addSink(instrumentation.CallbackSink(WORKER_SPANS.append))
+    if cacheDirectory != None:
+        WORKER_CACHE = analysisCache.AnalysisCache(cacheDirectory, cacheBytes)
+
+    recognition.MODEL_REGISTRY.modelPath = modelPath
+    if loadModel:
+        recognition.MODEL_REGISTRY.getModel()
+
+# True if the recording of job has to be recognized to find its target word.
+def needsRecognition(job):
+    filename, member, target, sentence = job
+    return not studyArchive.isIsolatedWord(filename if member == None else member)
+
+# Analyze one recording: a wave file, or a member of an archive if member
+# isn't None. Clips that are already just the target word skip recognition.
+# A recording that can't be decoded is reported on stderr and classified as
+# OTHER, so it doesn't stop the rest of the run.
+def analyzeFile(job):
+    filename, member, target, sentence = job
+    name = filename if member == None else member
+    logger = measurementLog.AnalysisRecord(name, target, sentence)
+
+    start = time.perf_counter()
+    try:
+        with instrumentation.span("decode") as decodeSpan:
+            if member == None:
+                samples, framerate = isolateSound.readWave(filename)
+            else:
+                samples, framerate = studyArchive.readRecording(filename, member)
+            decodeSpan.set(samples=len(samples), rate=framerate)
+    except Exception as error:
+        print(f"Can't read {filename if member == None else filename + ':' + member}: {error}", file=sys.stderr)
+        samples = None
+
+    if samples is None:
+        logger.write("\t" + target + "\nno tap or trill found\n")
+        result = isolateSound.OTHER
+    elif studyArchive.isIsolatedWord(name):
+        result = isolateSound.analyzeIsolatedWord(samples, framerate, target, logger, WORKER_CACHE)
+    else:
+        result = isolateSound.analyzeRecording(samples, framerate, target, logger, sentence=sentence, analysisCache=WORKER_CACHE)
+    referenceIndex.compareToNative(logger)
+
+    return {
+        "file": filename,
+        "member": member,
+        "target": target,
+        "word": logger.word,
+        "result": result,
+        "measurements": logger.measurements,
+        "seconds": round(time.perf_counter() - start, 4),
+        "log": logger.notes.getvalue(),
+        "spans": takeWorkerSpans(),
+        "cacheStats": WORKER_CACHE.takeStats() if WORKER_CACHE != None else None,
+    }
+
+def takeWorkerSpans():
+    spans = list(WORKER_SPANS)
+    del WORKER_SPANS[:]
+    return spans
+
+def analyzeChunk(jobs):
+    return [analyzeFile(job) for job in jobs]
+
+# Writes results one at a time as JSON lines or CSV rows, flushing after
+# each so partial runs are still usable.
+class ResultWriter:
+    def __init__(self, outFile, format):
+        self.outFile = outFile
+        self.csvWriter = None
+        if format == "csv":
+            self.csvWriter = csv.DictWriter(outFile, fieldnames=RESULT_FIELDS)
+            self.csvWriter.writeheader()
+
+    def write(self, result):
+        if self.csvWriter != None:
+            self.csvWriter.writerow({**result, "measurements": json.dumps(result["measurements"], default=float)})
+        else:
+            self.outFile.write(json.dumps(result, ensure_ascii=False, default=float) + "\n")
+        self.outFile.flush()
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Classify the rhotics in recorded study sentences.")
+    parser.add_argument("inputs", nargs="+", help="wave files, study zip archives, directories of either, or glob patterns")
+    parser.add_argument("-o", "--output", help="file to write results to (default: standard output)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="output format (default: from the output file's extension, else jsonl)")
+    parser.add_argument("--target", help="target word of every recording")
+    parser.add_argument("--targets", help="CSV file of 'file,word' lines giving each recording's target word")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=1, help="recordings handed to a worker at a time")
+    parser.add_argument("--model", default=recognition.MODEL_PATH, help="directory of the Vosk model")
+    parser.add_argument("--grammar", action="store_true", help="only recognize the words of each recording's study sentence")
+    parser.add_argument("--trace", help="write the timing span of every analysis stage to this JSON lines file")
+    parser.add_argument("--cache", help="directory to keep recognized words and feature tracks in between runs")
+    parser.add_argument("--cache-size", type=float, default=analysisCache.CACHE_MAX_BYTES / 1024 / 1024,
+        help="megabytes the cache is kept under, deleting the least recently used entries")
+    return parser.parse_args(argv)
+
+# Pair each recording with its target word (and sentence, for --grammar),
+# skipping recordings whose target word can't be worked out. Every study
+# recording in an archive becomes a job of its own, so the recordings of
+# many archives are analyzed side by side.
+def buildJobs(recordings, arguments):
+    targets = {}
+    if arguments.targets != None:
+        targets = readTargets(arguments.targets)
+
+    jobs = []
+    for filename in recordings:
+        if zipfile.is_zipfile(filename):
+            for member, target in studyArchive.listRecordings(filename):
+                sentence = sentences.sentenceForWord(target) if arguments.grammar else None
+                jobs.append((filename, member, target, sentence))
+            continue
+
+        target = arguments.target
+        if target == None:
+            target = targets.get(os.path.normpath(filename), sentences.targetWordForFile(filename))
+        if target == None:
+            print(f"Skipping {filename}: no target word", file=sys.stderr)
+            continue
+
+        sentence = None
+        if arguments.grammar:
+            sentence = sentences.sentenceForWord(target)
+
+        jobs.append((filename, None, target, sentence))
+    return jobs
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    jobs = buildJobs(findRecordings(arguments.inputs), arguments)
+
+    # Load the model before starting the workers, so a missing or broken
+    # model stops the run instead of every result coming out as OTHER.
+    # Workers forked from here start with it already loaded
+    recognition.MODEL_REGISTRY.modelPath = arguments.model
+    loadModel = any(needsRecognition(job) for job in jobs)
+    if loadModel:
+        try:
+            recognition.MODEL_REGISTRY.getModel()
+        except Exception as error:
+            sys.exit(f"Can't load the Vosk model {arguments.model}: {error}")
+
+    format = arguments.format
+    if format == None:
+        format = "csv" if arguments.output != None and arguments.output.endswith(".csv") else "jsonl"
+
+    outFile = sys.stdout if arguments.output == None else open(arguments.output, "w", newline='', encoding="utf-8")
+    writer = ResultWriter(outFile, format)
+
+    traceFile = None
+    if arguments.trace != None:
+        traceFile = open(arguments.trace, "w", encoding="utf-8")
+
+    chunkSize = max(1, arguments.chunk_size)
+    chunks = [jobs[i:i + chunkSize] for i in range(0, len(jobs), chunkSize)]
+    cacheStats = {}
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=arguments.workers, initializer=startWorker,
+                initargs=(arguments.model, loadModel, traceFile != None, arguments.cache, int(arguments.cache_size * 1024 * 1024))) as executor:
+            futures = [executor.submit(analyzeChunk, chunk) for chunk in chunks]
+            for future in concurrent.futures.as_completed(futures):
+                for result in future.result():
+                    spans = result.pop("spans")
+                    stats = result.pop("cacheStats")
+                    if stats != None:
+                        analysisCache.addStats(cacheStats, stats)
+                    writer.write(result)
+                    if traceFile != None:
+                        writeSpans(traceFile, result, spans)
+    finally:
+        if outFile != sys.stdout:
+            outFile.close()
+        if traceFile != None:
+            traceFile.close()
+
+    if arguments.cache != None:
+        print("Analysis cache: " + analysisCache.describeStats(analysisCache.addStats(cacheStats, {})), file=sys.stderr)
+
+# Write the spans of one recording's analysis as JSON lines, each labelled
+# with the recording it came from.
+def writeSpans(traceFile, result, spans):
+    for span in spans:
+        record = {"file": result["file"], "member": result["member"], **span}
+        traceFile.write(json.dumps(record, ensure_ascii=False) + "\n")
+    traceFile.flush()
+
+if __name__ == '__main__':
+    main()
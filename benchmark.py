@@ -0,0 +1,221 @@
+# Time each stage of findAndAnalyze over the native speaker recordings in
+# voiceExamples. The first pass is cold (the speech model is loaded from
+# scratch); the rest are warm. Stage times are summarised as percentiles,
+# along with peak memory, and can be saved as a baseline JSON file and
+# compared against on a later commit.
+#
+#   python benchmark.py --repeat 5 --save baseline.json
+#   python benchmark.py --repeat 5 --compare baseline.json
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+import isolateSound
+import recognition
+import sentences
+
+STAGES = ["model load", "decode", "recognition", "word slicing", "spectral band energy",
+"intensity and minima", "pitch and pulses", "trill detector", "tap detector"]
+PERCENTILES = [50, 90, 95, 99]
+
+# Times of each stage, added to as stages run, and optionally the most
+# memory each stage allocated on top of what was already held, as traced by
+# tracemalloc. Tracing slows Python code
+# down, so it is only turned on for the cold pass.
+class StageTimer:
+    def __init__(self, traceMemory=False):
+        self.seconds = {stage: [] for stage in STAGES}
+        self.peakBytes = {stage: 0 for stage in STAGES} if traceMemory else None
+
+    # Run function(*args) as stage and return its result.
+    def time(self, stage, function, *args):
+        if self.peakBytes != None:
+            tracemalloc.reset_peak()
+            heldBefore = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        result = function(*args)
+        self.seconds[stage].append(time.perf_counter() - start)
+
+        if self.peakBytes != None:
+            self.peakBytes[stage] = max(self.peakBytes[stage], tracemalloc.get_traced_memory()[1] - heldBefore)
+        return result
+
+# Run a detector that may give up with an IndexError the way
+# findAndAnalyze would, returning OTHER in that case.
+def runDetector(detector, *args):
+    try:
+        return detector(*args)
+    except IndexError:
+        return isolateSound.OTHER
+
+# Run every stage of findAndAnalyze on one recording. Without a speech
+# model, recognition is skipped and the whole recording is analyzed as the
+# word.
+def benchmarkRecording(timer, filename, target, useModel):
+    samples, framerate = timer.time("decode", isolateSound.readWave, filename)
+
+    words = [{"word": target, "start": 0, "end": len(samples) / framerate}]
+    if useModel:
+        words = timer.time("recognition", recognition.recognizeSamples, samples, framerate)
+
+    wordSamples = timer.time("word slicing", isolateSound.isolateWord, samples, framerate, target, None, words)
+    if wordSamples is None:
+        return isolateSound.OTHER
+    return benchmarkWord(timer, wordSamples, framerate)
+
+# Run the stages of analyzeWord on the samples of an isolated word.
+def benchmarkWord(timer, wordSamples, framerate):
+    sound = isolateSound.toSound(wordSamples, framerate)
+
+    def spectralStage():
+        spectralTrack = isolateSound.getSpectralPowerList(sound, sound.get_total_duration())
+        return isolateSound.trimSpectralPowerList(spectralTrack)
+    spectralTrack = timer.time("spectral band energy", spectralStage)
+    if len(spectralTrack) == 0:
+        return isolateSound.OTHER
+    average = sum(spectralTrack.values.tolist()) / len(spectralTrack)
+
+    def intensityStage():
+        intensityTrack = isolateSound.getIntensityTrack(sound)
+        try:
+            return isolateSound.findAllLocalMinima(intensityTrack)
+        except IndexError:
+            return None
+    minima = timer.time("intensity and minima", intensityStage)
+    if minima == None:
+        return isolateSound.OTHER
+
+    # Always time every stage, even when a trill ends the analysis early
+    trill = timer.time("trill detector", runDetector, isolateSound.checkForTrill, minima, spectralTrack, None)
+    pulseTimes = timer.time("pitch and pulses", isolateSound.getPulseTimes, sound)
+    tap = timer.time("tap detector", runDetector, isolateSound.checkForTap, spectralTrack, average, pulseTimes, minima, None)
+
+    return isolateSound.TRILL if trill == isolateSound.TRILL else tap
+
+def loadModel(timer):
+    recognition.MODEL_REGISTRY.unload()
+    try:
+        timer.time("model load", recognition.MODEL_REGISTRY.getModel)
+        return True
+    except Exception as error:
+        print(f"Speech model unavailable, skipping recognition: {error}", file=sys.stderr)
+        return False
+
+def summarise(timer):
+    summary = {}
+    for stage in STAGES:
+        seconds = timer.seconds[stage]
+        if len(seconds) == 0:
+            continue
+
+        summary[stage] = {"runs": len(seconds), "mean": float(numpy.mean(seconds))}
+        for percentile in PERCENTILES:
+            summary[stage][f"p{percentile}"] = float(numpy.percentile(seconds, percentile))
+        if timer.peakBytes != None:
+            summary[stage]["peakTracedBytes"] = timer.peakBytes[stage]
+    return summary
+
+# Largest resident memory this process has used, in bytes, where the
+# platform reports it.
+def getPeakResidentMemory():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def getCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def printSummary(title, summary):
+    print(title)
+    print(f"  {'stage':<22}{'runs':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for stage, stats in summary.items():
+        peak = "-"
+        if "peakTracedBytes" in stats:
+            peak = f"{stats['peakTracedBytes'] / (1024 * 1024):.2f}"
+        print(f"  {stage:<22}{stats['runs']:>6}{stats['p50'] * 1000:>10.2f}{stats['p90'] * 1000:>10.2f}"
+            f"{stats['p99'] * 1000:>10.2f}{peak:>10}")
+
+# Print how each warm stage's median compares with the baseline, and return
+# the stages that got slower than tolerance allows.
+def compare(baseline, results, tolerance):
+    regressions = []
+    print(f"Compared with baseline from commit {baseline.get('commit')}:")
+    for stage, stats in results["warm"].items():
+        if stage not in baseline["warm"]:
+            continue
+
+        ratio = stats["p50"] / baseline["warm"][stage]["p50"]
+        flag = ""
+        if ratio > tolerance:
+            flag = "  <-- slower"
+            regressions.append(stage)
+        print(f"  {stage:<22}{ratio:>8.2f}x{flag}")
+    return regressions
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Time each analysis stage over the bundled native speaker recordings.")
+    parser.add_argument("--repeat", type=int, default=3, help="warm passes over the recordings after the cold one")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the warm results with")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="slowdown of a stage's median that counts as a regression")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    recordings = list(zip(sentences.NATIVE_SPEAKER_VOICE_SAMPLES, sentences.TARGET_WORDS))
+
+    tracemalloc.start()
+    coldTimer = StageTimer(traceMemory=True)
+    useModel = loadModel(coldTimer)
+    for filename, target in recordings:
+        benchmarkRecording(coldTimer, filename, target, useModel)
+    tracemalloc.stop()
+
+    warmTimer = StageTimer()
+    for _ in range(arguments.repeat):
+        for filename, target in recordings:
+            benchmarkRecording(warmTimer, filename, target, useModel)
+
+    results = {
+        "commit": getCommit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "recordings": len(recordings),
+        "modelLoadMemoryBytes": recognition.MODEL_REGISTRY.loadMemoryBytes,
+        "peakResidentBytes": getPeakResidentMemory(),
+        "cold": summarise(coldTimer),
+        "warm": summarise(warmTimer),
+    }
+
+    printSummary("Cold", results["cold"])
+    printSummary("Warm", results["warm"])
+
+    if arguments.save != None:
+        with open(arguments.save, "w") as saveFile:
+            json.dump(results, saveFile, indent=2)
+
+    if arguments.compare != None:
+        with open(arguments.compare) as baselineFile:
+            regressions = compare(json.load(baselineFile), results, arguments.tolerance)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
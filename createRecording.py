@@ -1,18 +1,26 @@
 import tkinter
 from tkinter import ttk
-import pyaudio
 import wave
 import time
 import threading
+import analysisPool
+import audioEngine
 import isolateSound
+import measurementLog
+import recognition
 import re
+import referenceIndex
+import uiThread
+import voiceActivity
 
 # TODO: Can't press playback button twice
 
-AUDIO_FORMAT = pyaudio.paInt16
-AUDIO_CHANNELS = 1
-AUDIO_RATE = 44100
-AUDIO_BUF_FRAMES = 1024
+AUDIO_FORMAT = audioEngine.AUDIO_FORMAT
+AUDIO_CHANNELS = audioEngine.AUDIO_CHANNELS
+AUDIO_RATE = audioEngine.AUDIO_RATE
+AUDIO_BUF_FRAMES = audioEngine.AUDIO_BUF_FRAMES
+
+CONSTRAIN_RECOGNITION = False # Only listen for the words of the sentence being read. Off until checked against the model
 
 FOUND_CORRECT_TRILL = '''This sentence contains a trill (rolled R) sound. I detected this \
 sound in your speech. Great work!'''
@@ -49,24 +57,25 @@ this sentence includes a single 'R', most native speakers would pronounce this a
 speakers often make this same sound when pronouncing a 'T' or 'D' in the middle of a word. One \
 example is the 'T' in 'city'. Try pronouncing the 'R' in this sentence with this sound.'''
 
+# Widgets are only touched from the Tk main loop. Recording and playback run
+# on threads of their own and hand their updates back through uiThread.UI.
 class CreateRecording:
-    def __init__(self, button, label, filename, targetWord=None, wasRecorded=None, wasPlayed=None, nextButton=None, logFile=None, feedback=None):
+    def __init__(self, button, label, filename, targetWord=None, onRecorded=None, onPlayed=None, nextButton=None, logFile=None, feedback=None, sentence=None):
         self.filename = filename + ".wav" # Name of file to record speech to
 
         self.recording = True # True if in recording mode, false if in playback mode
 
         self.recordButtonUnpressed = True # True if button hasn't yet been pressed
-        self.playButtonUnpressed = True # True if button has only been pressed 1 or 2 times
 
-        self.wasRecorded = wasRecorded # An Event instance. Event will be set once recording is done.
-        self.wasPlayed = wasPlayed # An Event instance. Event will be set once recording was played back at least once.
+        self.onRecorded = onRecorded # Called on the main loop once recording is done
+        self.onPlayed = onPlayed # Called on the main loop each time the recording has been played back
         self.nextButton = nextButton # Another button. It's state will be set to NORMAL once recording is done.
 
         self.targetWord = targetWord # Word to analyze for tap, trill, or approximant
+        self.sentence = sentence # Sentence being read, logged and, with CONSTRAIN_RECOGNITION, used to constrain speech recognition
 
-        self.lock = threading.Event() # Set once recording is done
-
-        self.logger = logFile # Records Praat Measurements
+        self.logger = logFile # measurementLog.MeasurementLog that records Praat measurements
+        self.startLatency = None # Seconds from starting the take to its first captured frame
 
         self.button = button
         self.button.configure(text="Record", command=self.buttonRecordMode)
@@ -77,128 +86,189 @@ class CreateRecording:
         self.feedbackLabel = feedback
 
     # This method is called on the first two button presses. The first
-    # begins recording. The second ends and saves the recording, then
-    # changes the button to call playaudio when pressed.
+    # begins recording. The second ends it; once the recording is saved,
+    # the button is switched to playing it back.
     def buttonRecordMode(self):
         if (self.recordButtonUnpressed):
             self.recordButtonUnpressed = False
             threading.Thread(target=self.record).start()
-        else:
+        elif self.recording:
             self.recording = False
-            threading.Thread(target=self.buttonPlaybackMode).start()
+            self.button.config(state=tkinter.DISABLED)
 
     # This method is called on all button presses past the first two.
     # Play back the audio recorded by the first presses.
     def buttonPlaybackMode(self):
-        if (self.playButtonUnpressed):
-            self.playButtonUnpressed = False
-            self.lock.wait()
-            self.button.config(text="Play Back")
-        else:
-            threading.Thread(target=CreateRecording.playFileAudio, args=(self.filename, self.label, self.wasPlayed)).start()
-
-    # Ran in a thread when program is called to begin a recording. Records
-    # audio until recording is set to False. Then saves the recording
-    # to a .wav file labeled recording[number].wav in the current directory.
-    def record(self):
-        self.lock.clear()
-        audio = pyaudio.PyAudio()
-        stream = audio.open(format=AUDIO_FORMAT,
-                            channels=AUDIO_CHANNELS,
-                            rate=AUDIO_RATE,
-                            input=True,
-                            frames_per_buffer=AUDIO_BUF_FRAMES)
+        threading.Thread(target=CreateRecording.playFileAudio, args=(self.filename, self.label, self.onPlayed)).start()
 
-        frames = []
+    # Ran on the main loop once the recording has been saved.
+    def recordingDone(self):
+        self.button.config(text="Play Back", command=self.buttonPlaybackMode, state=tkinter.NORMAL)
 
-        start = time.time()
-        prevSecs = -1
+        if (isinstance(self.nextButton, ttk.Button)):
+            self.nextButton.config(state=tkinter.NORMAL)
 
-        while self.recording:
-            frames.append(stream.read(AUDIO_BUF_FRAMES))
+        if self.onRecorded != None:
+            self.onRecorded()
 
-            # Update time label for button to indicate current time in the recoring
-            prevSecs = CreateRecording.updateTimeLabel(self.label, start, prevSecs)
+    # Ran in a thread when program is called to begin a recording. Records
+    # audio until recording is set to False, saving it as it comes in to a
+    # .wav file labeled recording[number].wav in the current directory. Only
+    # the speech and a little silence either side of it is saved, recognized
+    # and analyzed.
+    def record(self):
+        # This take supersedes any earlier take of the sentence still being analyzed
+        if self.feedbackLabel != None:
+            analysisPool.ANALYSIS_POOL.cancel(self.feedbackLabel)
 
-        stream.stop_stream()
-        stream.close()
-        audio.terminate()
+        engine = audioEngine.AUDIO_ENGINE
+        capture = audioEngine.CaptureBuffer(AUDIO_RATE)
+        trimmer = voiceActivity.SpeechTrimmer(capture)
+        writeFile = isolateSound.openWaveWriter(self.filename, AUDIO_RATE)
 
-        with wave.open(self.filename, "wb") as writeFile:
-            writeFile.setnchannels(AUDIO_CHANNELS)
-            writeFile.setsampwidth(audio.get_sample_size(AUDIO_FORMAT))
-            writeFile.setframerate(AUDIO_RATE)
-            writeFile.writeframes(b"".join(frames))
+        # Capture starts before anything else, so nothing holds up the first
+        # frames; they wait in capture until the loop below reads them
+        engine.startInput(capture)
+        try:
+            recognizer = self.startRecognizer()
 
-        self.lock.set()
+            start = time.time()
+            prevSecs = -1
 
-        if (isinstance(self.wasRecorded, threading.Event)):
-            self.wasRecorded.set()
+            # Chunks keep coming until the ones captured before stopping run out
+            chunk = capture.nextChunk(timeout=0.5)
+            while chunk != None:
+                if len(chunk) > 0:
+                    self.keepAudio(trimmer.accept(chunk), writeFile, recognizer)
 
-        if (isinstance(self.nextButton, ttk.Button)):
-            self.nextButton.config(state=tkinter.NORMAL)
-        
-        if self.targetWord != None and self.feedbackLabel != None:
-                soundFound = isolateSound.findAndAnalyze(self.filename, self.targetWord, self.logger)
-                matchTrill = re.search("rr", self.targetWord)
-                matchTap = re.search("r", self.targetWord)
-
-                if soundFound == isolateSound.TRILL:
-                    if matchTrill != None:
-                        self.feedbackLabel.config(text=FOUND_CORRECT_TRILL)
-                    else:
-                        self.feedbackLabel.config(text=FOUND_INCORRECT_TRILL)
-                elif soundFound == isolateSound.TAP:
-                    if matchTap != None and matchTrill == None:
-                        self.feedbackLabel.config(text=FOUND_CORRECT_TAP)
-                    else:
-                        self.feedbackLabel.config(text=FOUND_INCORRECT_TAP)
+                if self.recording:
+                    # Update time label for button to indicate current time in the recoring
+                    prevSecs = CreateRecording.updateTimeLabel(self.label, start, prevSecs)
                 else:
-                    if matchTrill != None:
-                        self.feedbackLabel.config(text=FOUND_NEITHER_TRILL)
-                    else:
-                        self.feedbackLabel.config(text=FOUND_NEITHER_TAP)
-    
-    def isRecorded(self):
-        return self.wasRecorded
-
-    def isPlayed(self):
-        return self.wasPlayed
-
-    # Play the audio from filename
-    def playFileAudio(filename, label, wasPlayed=None):
-        with wave.open(filename, 'rb') as readFile:
-            audio = pyaudio.PyAudio()
+                    engine.stopInput(capture)
 
-            # 'output = True' indicates that the sound will be played rather than recorded
-            stream = audio.open(format=AUDIO_FORMAT,
-                                channels=AUDIO_CHANNELS,
-                                rate=AUDIO_RATE,
-                                output=True)
+                chunk = capture.nextChunk(timeout=0.5)
+            self.keepAudio(trimmer.finish(), writeFile, recognizer)
+        finally:
+            engine.stopInput(capture)
+            writeFile.close()
+        self.startLatency = engine.lastInputLatency()
 
-            data = readFile.readframes(AUDIO_BUF_FRAMES)
+        uiThread.UI.call(self.recordingDone)
 
-            start = time.time()
-            prevSecs = -1
+        if self.targetWord != None and self.feedbackLabel != None:
+            analysisPool.ANALYSIS_POOL.submit(self.feedbackLabel, self.analyze, recognizer, capture, trimmer, onDone=self.showFeedback)
+
+    # Return a StreamingRecognizer to recognize speech while recording, so
+    # the words are ready as soon as recording stops, or None. Only a model
+    # that is already loaded is used: waiting for one still loading would
+    # hold up the take, so the saved speech is recognized during analysis
+    # instead.
+    def startRecognizer(self):
+        if self.targetWord == None or self.feedbackLabel == None or not recognition.MODEL_REGISTRY.isLoaded():
+            return None
+
+        try:
+            grammar = None
+            if CONSTRAIN_RECOGNITION and self.sentence != None:
+                grammar = recognition.buildGrammar(self.sentence, self.targetWord)
+            return recognition.StreamingRecognizer(AUDIO_RATE, grammar=grammar)
+        except Exception:
+            return None
+
+    # Save and recognize audio the trimmer has kept.
+    def keepAudio(self, data, writeFile, recognizer):
+        if len(data) > 0:
+            writeFile.writeframesraw(data)
+            if recognizer != None:
+                recognizer.acceptAudio(data)
+
+    # Ran on an analysis thread once recording is done. Classifies the rhotic
+    # in the target word, straight from the speech trimmer kept of capture,
+    # and returns the feedback to show, stopping early if job is cancelled by
+    # a newer take.
+    def analyze(self, job, recognizer, capture, trimmer):
+        if job.isCancelled():
+            if recognizer != None:
+                recognizer.cancel()
+            return None
+
+        words = None
+        if recognizer != None:
+            words = recognizer.finish()
+
+        record = measurementLog.AnalysisRecord(self.filename, self.targetWord, self.sentence)
+        record.measure("captureLatency", self.startLatency)
+        record.measure("captureOverflows", capture.overflows)
+        record.measure("captureSeconds", len(capture.samples()) / capture.rate)
+        record.measure("speechStart", trimmer.startSeconds())
+        record.measure("speechEnd", trimmer.endSeconds())
+        soundFound = isolateSound.analyzeRecording(trimmer.samples(), capture.rate, self.targetWord, record, words=words,
+            sentence=self.sentence if CONSTRAIN_RECOGNITION else None, wordFile=self.targetWord + "-only" + self.filename, cancelled=job.cancelled)
+        if job.isCancelled():
+            return None
+
+        record.setResult(soundFound)
+        referenceIndex.compareToNative(record)
+        if self.logger != None:
+            self.logger.write(record)
+
+        return CreateRecording.getFeedback(self.targetWord, soundFound)
+
+    def showFeedback(self, job, feedback):
+        analysisPool.postFeedback(self.feedbackLabel, feedback, job)
+
+    # Return the feedback for finding soundFound in targetWord.
+    def getFeedback(targetWord, soundFound):
+        matchTrill = re.search("rr", targetWord)
+        matchTap = re.search("r", targetWord)
+
+        if soundFound == isolateSound.TRILL:
+            if matchTrill != None:
+                return FOUND_CORRECT_TRILL
+            else:
+                return FOUND_INCORRECT_TRILL
+        elif soundFound == isolateSound.TAP:
+            if matchTap != None and matchTrill == None:
+                return FOUND_CORRECT_TAP
+            else:
+                return FOUND_INCORRECT_TAP
+        else:
+            if matchTrill != None:
+                return FOUND_NEITHER_TRILL
+            else:
+                return FOUND_NEITHER_TAP
 
-            # Play the sound by writing the audio data to the stream and display the time
-            while data != b'':
-                stream.write(data)
+    # Play the audio from filename, then call onPlayed on the main loop
+    def playFileAudio(filename, label, onPlayed=None):
+        with wave.open(filename, 'rb') as readFile:
+            engine = audioEngine.AUDIO_ENGINE
+
+            # Waits for any take or other playback using the device
+            engine.startOutput()
+            try:
                 data = readFile.readframes(AUDIO_BUF_FRAMES)
 
-                prevSecs = CreateRecording.updateTimeLabel(label, start, prevSecs)
+                start = time.time()
+                prevSecs = -1
+
+                # Play the sound by writing the audio data to the stream and display the time
+                while data != b'':
+                    engine.writeOutput(data)
+                    data = readFile.readframes(AUDIO_BUF_FRAMES)
 
-            stream.close()
-            audio.terminate()
+                    prevSecs = CreateRecording.updateTimeLabel(label, start, prevSecs)
+            finally:
+                engine.stopOutput()
 
-            if (isinstance(wasPlayed, threading.Event)):
-                wasPlayed.set()
+            if onPlayed != None:
+                uiThread.UI.call(onPlayed)
 
     def updateTimeLabel(label, start, prevSecs):
         timePassed = time.time() - start
         secs = int(timePassed % 60)
         mins = int(timePassed // 60)
         if (secs != prevSecs):
-            label.configure(text=f"{mins}:{secs:02d}")
+            uiThread.UI.call(label.configure, text=f"{mins}:{secs:02d}")
         
         return secs
\ No newline at end of file
@@ -0,0 +1,165 @@
+# Timing spans around the stages of an analysis. Code marks a stage with
+#
+#   with instrumentation.span("tap detector", frames=n) as stageSpan:
+#       ...
+#       stageSpan.set(pulses=len(pulseTimes))
+#
+# and every finished span is handed to the installed sinks: a callback, a
+# JSON lines file or cProfile. While no sink is installed, span() returns a
+# shared do-nothing span, so instrumented code costs next to nothing.
+
+import cProfile
+import json
+import threading
+import time
+
+SINKS = [] # Installed sinks, each with startSpan(span) and finishSpan(span)
+
+# Spans open on the current thread, innermost last
+openSpans = threading.local()
+
+def addSink(sink):
+    SINKS.append(sink)
+    return sink
+
+def removeSink(sink):
+    if sink in SINKS:
+        SINKS.remove(sink)
+
+def isEnabled():
+    return len(SINKS) > 0
+
+# One timed stage. attributes hold the sizes of what the stage worked on,
+# and outcome is "ok", the classification it reached, or the name of the
+# exception that ended it.
+class Span:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.outcome = "ok"
+        self.parent = None # Name of the span this one ran inside, if any
+        self.depth = 0 # Number of spans this one ran inside
+        self.start = None # time.time() when the span started
+        self.startCounter = None # time.perf_counter() when the span started
+        self.seconds = None # Duration, once finished
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def setOutcome(self, outcome):
+        self.outcome = outcome
+
+    def __enter__(self):
+        stack = getattr(openSpans, "stack", None)
+        if stack == None:
+            stack = openSpans.stack = []
+        if len(stack) > 0:
+            self.parent = stack[-1].name
+        self.depth = len(stack)
+        stack.append(self)
+
+        for sink in SINKS:
+            sink.startSpan(self)
+
+        self.start = time.time()
+        self.startCounter = time.perf_counter()
+        return self
+
+    def __exit__(self, errorType, error, traceback):
+        self.seconds = time.perf_counter() - self.startCounter
+        if errorType != None:
+            self.outcome = errorType.__name__
+
+        openSpans.stack.pop()
+        for sink in SINKS:
+            sink.finishSpan(self)
+        return False
+
+    def toRecord(self):
+        return {
+            "span": self.name,
+            "parent": self.parent,
+            "start": self.start,
+            "seconds": self.seconds,
+            "outcome": self.outcome,
+            **self.attributes,
+        }
+
+# Stands in for every span while instrumentation is off.
+class NullSpan:
+    def set(self, **attributes):
+        pass
+
+    def setOutcome(self, outcome):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, errorType, error, traceback):
+        return False
+
+NULL_SPAN = NullSpan()
+
+# Return a span for the stage name, to be used in a with statement.
+def span(name, **attributes):
+    if len(SINKS) == 0:
+        return NULL_SPAN
+    return Span(name, attributes)
+
+# Calls callback with the record of each finished span.
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def startSpan(self, span):
+        pass
+
+    def finishSpan(self, span):
+        self.callback(span.toRecord())
+
+# Writes the record of each finished span to an open text file as a line of
+# JSON. Spans may finish on several threads at once.
+class JsonlSink:
+    def __init__(self, outFile):
+        self.outFile = outFile
+        self.lock = threading.Lock()
+
+    def startSpan(self, span):
+        pass
+
+    def finishSpan(self, span):
+        line = json.dumps(span.toRecord(), ensure_ascii=False) + "\n"
+        with self.lock:
+            self.outFile.write(line)
+
+# Runs cProfile while outermost spans are open, so the profile covers the
+# analysis and none of the idle time around it. cProfile can only follow one
+# thread, so spans opened on other threads while profiling are skipped.
+class ProfileSink:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.profiledSpan = None # Outermost span being profiled
+        self.lock = threading.Lock()
+
+    def startSpan(self, span):
+        if span.depth != 0:
+            return
+
+        with self.lock:
+            if self.profiledSpan == None:
+                self.profiledSpan = span
+                self.profiler.enable()
+
+    def finishSpan(self, span):
+        with self.lock:
+            if self.profiledSpan is span:
+                self.profiler.disable()
+                self.profiledSpan = None
+
+    # Write the profile in the format read by pstats and snakeviz.
+    def dump(self, filename):
+        self.profiler.dump_stats(filename)
+
+    def printStats(self, sort="cumulative"):
+        self.profiler.print_stats(sort)
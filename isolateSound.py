@@ -1,10 +1,11 @@
 import wave
-import sys
-import json
-from math import trunc
+import numpy
 import parselmouth
 
-import vosk
+import tracks
+
+import instrumentation
+import recognition
 
 TRILL = 'trill'
 TAP = 'tap'
@@ -14,33 +15,90 @@ AUDIO_CHANNELS = 1
 AUDIO_RATE = 44100
 AUDIO_BUF_FRAMES = 1024
 
-def isolateWord(filename, targetWord, logger=None):
+SPECTRAL_TIME_STEP = 0.002 # Seconds between band energy measurements
+INTENSITY_TIME_STEP = 0.0005 # Seconds between intensity measurements
+
+# Raised between the stages of an analysis once it has been cancelled.
+class AnalysisCancelled(Exception):
+    pass
+
+# Stop the analysis if cancelled, a threading.Event or None, has been set.
+def checkCancelled(cancelled):
+    if cancelled != None and cancelled.is_set():
+        raise AnalysisCancelled()
+
+# Decode a mono 16 bit wave file, given as a filename or an open binary file,
+# into an array of samples. Returns the samples and the sample rate. Raises
+# ValueError for any other format, and wave.Error for files that aren't WAV.
+def readWave(source):
+    with wave.open(source, "rb") as wf:
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
+            raise ValueError("audio file must be WAV format mono 16 bit PCM")
+
+        return numpy.frombuffer(wf.readframes(wf.getnframes()), dtype=numpy.int16), wf.getframerate()
+
+# Open a mono 16 bit wave file to be written a chunk at a time with
+# writeframesraw(). The header is filled in when it is closed.
+def openWaveWriter(filename, framerate):
+    outfile = wave.open(filename, 'wb')
+    outfile.setnchannels(AUDIO_CHANNELS)
+    outfile.setsampwidth(2)
+    outfile.setframerate(framerate)
+    return outfile
+
+# Write samples to a mono 16 bit wave file.
+def writeWave(filename, samples, framerate):
+    with wave.open(filename, 'w') as outfile:
+        outfile.setnchannels(AUDIO_CHANNELS)
+        outfile.setsampwidth(2)
+        outfile.setframerate(framerate)
+        outfile.setnframes(len(samples))
+        outfile.writeframes(samples.tobytes())
+
+# Pass a measurement to logger by name, if the logger keeps measurements as
+# well as notes (see measurementLog.AnalysisRecord).
+def logMeasurement(logger, name, value):
+    if logger != None and hasattr(logger, "measure"):
+        logger.measure(name, value)
+
+# Find targetWord in a recording and return just that word's samples, as a
+# view of samples, or None if the word wasn't recognized.
+# words are the recognizer's results for the recording if they were already
+# produced while recording; otherwise the samples are recognized here,
+# limited to the words of sentence if the sentence being read is given.
+# Recognized words are kept in analysisCache, an analysisCache.AnalysisCache,
+# if one is given.
+def isolateWord(samples, framerate, targetWord, logger=None, words=None, sentence=None, analysisCache=None):
     if logger != None:
         logger.write("\t" + targetWord + "\n")
 
-    vosk.SetLogLevel(-1) # Disable debug messages
-
-    wf = wave.open(filename, "rb")
-    if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
-        print("Audio file must be WAV format mono PCM.")
-        sys.exit(1)
-
-    model = vosk.Model(model_path="vosk-model-small-es-0.42")
+    if words == None:
+        grammar = None
+        if sentence != None:
+            grammar = recognition.buildGrammar(sentence, targetWord)
 
-    rec = vosk.KaldiRecognizer(model, wf.getframerate())
-    rec.SetWords(True)
+        if analysisCache != None:
+            words = analysisCache.getWords(samples, framerate, targetWord, grammar)
 
-    data = wf.readframes(4000)
+    if words == None:
+        with instrumentation.span("recognition", samples=len(samples), grammar=grammar != None) as recognitionSpan:
+            words = recognition.recognizeSamples(samples, framerate, grammar=grammar)
+            recognitionSpan.set(words=len(words))
 
-    while len(data) != 0:
-        rec.AcceptWaveform(data)
-        data = wf.readframes(4000)
+        if analysisCache != None:
+            analysisCache.putWords(samples, framerate, targetWord, grammar, words)
 
-    resultDict = json.loads(rec.FinalResult())
+    with instrumentation.span("word slicing", words=len(words)) as slicingSpan:
+        wordSamples = sliceWord(samples, framerate, targetWord, words, logger)
+        slicingSpan.setOutcome("found" if wordSamples is not None else "not found")
+    return wordSamples
 
+# Return the samples of targetWord, as found by the recognizer in words, or
+# None if neither it nor a close match was recognized.
+def sliceWord(samples, framerate, targetWord, words, logger):
     detectedWord = "ArbitraryIncorrectValue"
 
-    for i in resultDict["result"]:
+    for i in words:
         if i["word"].lower() == targetWord.lower():
             detectedWord = i["word"].lower()
             if logger != None:
@@ -49,7 +107,7 @@ def isolateWord(filename, targetWord, logger=None):
     
     # If didn't find a match for the word, see if there's a close match
     if i["word"].lower() != targetWord.lower():
-        detectedWord = findCloseMatch(resultDict, targetWord.lower(), logger)
+        detectedWord = findCloseMatch(words, targetWord.lower(), logger)
 
         # If word is not found, return None
         if detectedWord == None:
@@ -59,34 +117,21 @@ def isolateWord(filename, targetWord, logger=None):
         else: # Otherwise, proceed with the close match word
             i = detectedWord
 
-    # file to extract the snippet from
-    with wave.open(filename, "rb") as infile:
-        # get file data
-        sampwidth = infile.getsampwidth()
-        # set position in wave to start of segment
-        infile.setpos(int(i["start"] * AUDIO_RATE))
-        # extract data
-        data = infile.readframes(int((i["end"] - i["start"]) * AUDIO_RATE))
+    logMeasurement(logger, "word", i["word"])
+    logMeasurement(logger, "wordStart", i["start"])
+    logMeasurement(logger, "wordEnd", i["end"])
+    logMeasurement(logger, "wordConfidence", i.get("conf"))
 
-    newFile = targetWord + "-only" + filename
+    start = int(i["start"] * framerate)
+    return samples[start:start + int((i["end"] - i["start"]) * framerate)]
 
-    # write the extracted data to a new file
-    with wave.open(newFile, 'w') as outfile:
-        outfile.setnchannels(AUDIO_CHANNELS)
-        outfile.setsampwidth(sampwidth)
-        outfile.setframerate(AUDIO_RATE)
-        outfile.setnframes(int(len(data) / sampwidth))
-        outfile.writeframes(data)
-
-    return newFile
-
-# Determine if any results in resultDict are a close match to
+# Determine if any recognized words are a close match to
 # targetWord. Return targetWord if so.
 # A close match is defined as a word that is the same but with
 # one letter being different, one letter being added, or one
 # letter being removed.
-def findCloseMatch(resultDict, targetWord, logger):
-    for i in resultDict["result"]:
+def findCloseMatch(words, targetWord, logger):
+    for i in words:
         detectedWord = i["word"].lower()
         
         # 1 letter wrong
@@ -152,185 +197,428 @@ def findCloseMatch(resultDict, targetWord, logger):
     # Loop ended without returning, meaning no match found
     return None
 
-def analyzeWord(filename, logger=None):
-    sound = parselmouth.Sound(filename)
+# Build a Praat sound from 16 bit samples, scaled the way Praat scales
+# samples it reads from a wave file.
+def toSound(samples, framerate):
+    return parselmouth.Sound(samples / 32768, sampling_frequency=framerate)
 
-    with wave.open(filename, 'rb') as file:
-        duration = file.getnframes() / AUDIO_RATE
+# Classify the rhotic in an isolated word as a TRILL, TAP or OTHER. sound is a
+# parselmouth.Sound or the name of a wave file. cache optionally holds what
+# was already computed for this sound, such as its pitch or its tracks, and
+# is filled in with what is computed here (see analysisCache for keeping it
+# between runs). Setting cancelled, a threading.Event, stops the analysis
+# with AnalysisCancelled at the next stage.
+def analyzeWord(sound, logger=None, cache=None, cancelled=None):
+    if isinstance(sound, str):
+        sound = parselmouth.Sound(sound)
 
-    spectralPowerList = getSpectralPowerList(sound, duration)
+    duration = sound.get_total_duration()
 
-    # Omit initial and end silence to get better average
-    # This will help calibrate occlusion threshhold
-    spectralPowerList = trimSpectralPowerList(spectralPowerList)
+    with instrumentation.span("spectral band energy", audioSeconds=duration) as spectralSpan:
+        spectralTrack = getSpectralPowerList(sound, duration, cache)
 
-    # spectralPowerList average
-    average = sum([row[0] for row in spectralPowerList]) / len(spectralPowerList)
+        # Omit initial and end silence to get better average
+        # This will help calibrate occlusion threshhold
+        spectralTrack = trimSpectralPowerList(spectralTrack)
+        spectralSpan.set(frames=len(spectralTrack))
 
-    durationList = []
-    intensity = sound.to_intensity(time_step=0.0005)
-    times = intensity.xs()
-    intensities = intensity.values.T
-    for i in range(len(times)):
-        durationList.append((intensities[i][0], times[i]))
-    
-    minima = findAllLocalMinima(durationList)
+    # spectralTrack average
+    average = sum(spectralTrack.values.tolist()) / len(spectralTrack)
+    logMeasurement(logger, "averagePower", average)
 
-    trillFound = checkForTrill(minima, spectralPowerList, logger)
+    checkCancelled(cancelled)
+
+    with instrumentation.span("intensity and minima") as intensitySpan:
+        intensityTrack = getIntensityTrack(sound, cache)
+        intensitySpan.set(frames=len(intensityTrack))
+
+        minima = findAllLocalMinima(intensityTrack)
+        intensitySpan.set(minima=len(minima))
+
+    checkCancelled(cancelled)
+
+    with instrumentation.span("trill detector", minima=len(minima)) as trillSpan:
+        trillFound = checkForTrill(minima, spectralTrack, logger)
+        trillSpan.setOutcome(TRILL if trillFound == TRILL else "no trill")
     if trillFound == TRILL:
         return TRILL
 
-    pitch = sound.to_pitch()
+    checkCancelled(cancelled)
+
+    with instrumentation.span("pitch and pulses") as pulseSpan:
+        pulseTimes = getPulseTimes(sound, cache)
+        pulseSpan.set(pulses=len(pulseTimes))
+
+    checkCancelled(cancelled)
+
+    with instrumentation.span("tap detector", frames=len(spectralTrack), pulses=len(pulseTimes)) as tapSpan:
+        result = checkForTap(spectralTrack, average, pulseTimes, minima, logger)
+        tapSpan.setOutcome(result)
+    return result
+
+# Return the pitch of sound, computing it only once per cache. cache is a
+# dict shared by the stages analysing the same sound, or None to not cache.
+def getPitch(sound, cache=None):
+    if cache == None:
+        return sound.to_pitch()
+
+    if "pitch" not in cache:
+        cache["pitch"] = sound.to_pitch()
+    return cache["pitch"]
+
+# Return the times of every glottal pulse in sound as an array. All times
+# are read from Praat in a single conversion to a 1 x n matrix rather than
+# one "Get time from index" call per pulse. Computed only once per cache.
+def getPulseTimes(sound, cache=None):
+    if cache != None and "pulseTimes" in cache:
+        return cache["pulseTimes"]
+
+    pitch = getPitch(sound, cache)
     pulses = parselmouth.praat.call([sound, pitch], "To PointProcess (cc)")
-    numPulses = parselmouth.praat.call(pulses, "Get number of points")
-    pulseList = []
-    for pulseIndex in range(1, numPulses+1):
-        pulseList.append(parselmouth.praat.call(pulses, "Get time from index", pulseIndex))
-
-    # Check for tap
-    tapsFound = 0
-    i = 0
-    j = 0
-    numFalseOutliers = 0
-    min = None
-    tapStart = None
-    tapEnd = None
-    while i < len(spectralPowerList):
-        if spectralPowerList[i][0] < (average / 2.5):
-            sharpOutlier = False
-            outliers = 0
-            j = 0
-            while i < len(spectralPowerList) and j < 25 and outliers < 6:
-                if spectralPowerList[i][0] > (average / 2.5) and spectralPowerList[i][0] < (average / 1.3):
-                    outliers += 1
-                elif spectralPowerList[i][0] > (average / 1.3):
-                    if sharpOutlier:
-                        break
-                    sharpOutlier = True
-                i += 1
-                j += 1
-            
-            # Do not count 'outliers' that came at the occlusion. Outliers are
-            # only sound in the middle of the occlusion
-            numFalseOutliers = 0
-            for k in range(outliers):
-                if spectralPowerList[i-1-k][0] < (average / 2.5):
-                    j -= 1
-                    numFalseOutliers += 1
-
-            if j <= 30 and j >= 8:
-                numPulsesInRange = 0
-                for k in pulseList:
-                    if k > spectralPowerList[i-j-numFalseOutliers][1] and k < spectralPowerList[i-numFalseOutliers][1]:
-                        numPulsesInRange += 1
-                
-                if numPulsesInRange >= j//10:
-                    for min in minima:
-                        if min[1] < spectralPowerList[i-numFalseOutliers][1] and min[1] > spectralPowerList[i-j-numFalseOutliers][1]:
-                            tapStart = spectralPowerList[i-j-numFalseOutliers][1]
-                            tapEnd = spectralPowerList[i-numFalseOutliers][1]
-                            tapsFound += 1
-                            break
-        i += 1
-
-    if tapsFound == 1:
+
+    # Praat refuses to convert an empty PointProcess
+    if parselmouth.praat.call(pulses, "Get number of points") == 0:
+        pulseTimes = numpy.empty(0)
+    else:
+        pulseTimes = parselmouth.praat.call(pulses, "To Matrix").values[0]
+
+    if cache != None:
+        cache["pulseTimes"] = pulseTimes
+    return pulseTimes
+
+# Return the IntensityTrack of sound every INTENSITY_TIME_STEP seconds.
+# Computed only once per cache.
+def getIntensityTrack(sound, cache=None):
+    if cache != None and "intensityTrack" in cache:
+        return cache["intensityTrack"]
+
+    intensityTrack = tracks.IntensityTrack.fromIntensity(sound.to_intensity(time_step=INTENSITY_TIME_STEP))
+    if cache != None:
+        cache["intensityTrack"] = intensityTrack
+    return intensityTrack
+
+# Return a SpectralTrack of the band energy of the whole sound, one frame
+# every SPECTRAL_TIME_STEP seconds. The band energy of each spectrogram column
+# is computed in one matrix product, giving the same values as taking a
+# Praat spectrum slice and calling get_band_energy() at every step. Computed
+# only once per cache.
+def getSpectralPowerList(sound, duration, cache=None):
+    if cache != None and "spectralTrack" in cache:
+        return cache["spectralTrack"]
+
+    spectrogram = sound.to_spectrogram()
+
+    times = getSpectralTimes(duration)
+    frames = getNearestFrames(spectrogram, times)
+    power = getBandEnergies(spectrogram)[frames]
+
+    spectralTrack = tracks.SpectralTrack(power, times, SPECTRAL_TIME_STEP)
+    if cache != None:
+        cache["spectralTrack"] = spectralTrack
+    return spectralTrack
+
+# Times 0, 0.002, 0.004... up to duration, accumulated step by step so they
+# match the original float loop exactly.
+def getSpectralTimes(duration):
+    steps = numpy.full(int(numpy.ceil(duration / SPECTRAL_TIME_STEP)) + 2, SPECTRAL_TIME_STEP)
+    steps[0] = 0
+    times = numpy.cumsum(steps)
+    return times[times < duration]
+
+# Index of the spectrogram column closest to each time, clamped to the
+# spectrogram the same way as Praat's Spectrogram_to_Spectrum.
+def getNearestFrames(spectrogram, times):
+    frames = numpy.floor((times - spectrogram.x1) / spectrogram.dx + 0.5).astype(int)
+    return numpy.clip(frames, 0, spectrogram.nx - 1)
+
+# Band energy over the full frequency range of every spectrogram column.
+# Each frequency bin is weighted by how much of it lies inside the
+# 0 - ymax range of the spectrum slice Praat would build from the column.
+def getBandEnergies(spectrogram):
+    binCentres = spectrogram.y1 + spectrogram.dy * numpy.arange(spectrogram.ny)
+    binLow = numpy.maximum(binCentres - spectrogram.dy / 2, 0)
+    binHigh = numpy.minimum(binCentres + spectrogram.dy / 2, spectrogram.ymax)
+    weights = numpy.maximum(binHigh - binLow, 0)
+
+    # Energy of a real spectrum is twice the integral of its power density
+    return 2 * (weights @ spectrogram.values)
+
+# Return the part of spectralTrack between the first and last frames
+# louder than the silence threshold. The result is a view of the same arrays.
+def trimSpectralPowerList(spectralTrack):
+    loud = spectralTrack.values > 20
+
+    # Omit initial silence
+    louder = numpy.flatnonzero(loud)
+    start = louder[0] if len(louder) > 0 else len(spectralTrack) - 1
+    trimmedTrack = spectralTrack[start:]
+
+    # Now omit end silence. The last loud frame itself is dropped, and a
+    # track with no loud frames after its first keeps only that first frame.
+    louder = numpy.flatnonzero(loud[start + 1:])
+    if len(louder) > 0:
+        end = louder[-1] + 1
+    elif len(trimmedTrack) > 1:
+        end = 1
+    else:
+        end = start
+    trimmedTrack = trimmedTrack[:end]
+
+    return trimmedTrack
+
+# Return the frames of intensityTrack that are local minima deep enough to
+# be an occlusion, as a track of their own. Every frame is tested at once by
+# comparing the track against shifted copies of itself.
+def findAllLocalMinima(intensityTrack):
+    values = intensityTrack.values
+    candidates = numpy.arange(16, len(values) - 16)
+    if len(candidates) == 0:
+        return intensityTrack[candidates]
+
+    current = values[candidates]
+    candidates = candidates[(current < values[candidates - 1]) & (current < values[candidates + 1])]
+
+    # Candidates within 20 frames of the end have no right-hand neighbour to
+    # measure depth against. Those near the start borrow theirs from the end
+    # of the track, as negative indices do.
+    if len(candidates) > 0 and candidates[-1] + 20 >= len(values):
+        raise IndexError("local minimum too close to the end of the intensity track")
+
+    current = values[candidates]
+    depth = ((values[candidates - 20] - current) + (values[candidates + 20] - current)) / 2
+    isMinimum = (depth > 0.6) & (values[candidates - 8] > current) & (values[candidates + 8] > current)
+
+    return intensityTrack[candidates[isMinimum]]
+
+# Look for two occlusions less than 60ms apart with louder sound between
+# them. Returns TRILL for the first such pair, or None if there isn't one.
+def checkForTrill(minima, spectralTrack, logger):
+    times = minima.times
+    pairs = numpy.flatnonzero(times[1:] - times[:-1] < .06)
+    if len(pairs) == 0:
+        return None
+
+    firstFrames = spectralTrack.framesAt(times[pairs])
+    secondFrames = spectralTrack.framesAt(times[pairs + 1])
+    middleFrames = (firstFrames + secondFrames) // 2
+
+    firstPower, firstValid = getWindowMeans(spectralTrack.values, firstFrames)
+    secondPower, secondValid = getWindowMeans(spectralTrack.values, secondFrames)
+    middlePower, middleValid = getWindowMeans(spectralTrack.values, middleFrames)
+
+    isTrill = ((firstPower + secondPower) / 2) < (middlePower / 2)
+    isValid = firstValid & secondValid & middleValid
+
+    # Pairs are judged in order, so a window that runs off the track
+    # only matters if it comes before the first trill.
+    decided = numpy.flatnonzero(isTrill | ~isValid)
+    if len(decided) == 0:
+        return None
+
+    pair = decided[0]
+    if not isValid[pair]:
+        raise IndexError("occlusion window outside the spectral track")
+
+    if logger != None:
+        logger.write("trill found\n")
+        logger.write(f"first occlusions: {times[pairs[pair]]}, {times[pairs[pair] + 1]}" + "\n")
+        logMeasurement(logger, "firstOcclusion", times[pairs[pair]])
+        logMeasurement(logger, "secondOcclusion", times[pairs[pair] + 1])
+    return TRILL
+
+# Look for exactly one occlusion: a run of quiet frames lasting 16-60ms,
+# allowing a few louder outliers, that contains glottal pulses and one of the
+# intensity minima. Returns TAP if there is exactly one, otherwise OTHER.
+#
+# Each occlusion is scanned from a frame below average / 2.5 until 25 frames
+# pass, 6 moderate outliers are seen, or a second sharp outlier is reached.
+# Running counts of quiet, outlier and sharp frames let every scan be resolved
+# with a few lookups, so the detector only steps from occlusion to occlusion,
+# and pulses and minima in range are counted by binary search.
+def checkForTap(spectralTrack, average, pulseTimes, minima, logger):
+    power = spectralTrack.values
+    times = spectralTrack.times
+    numFrames = len(power)
+    pulseTimes = numpy.asarray(pulseTimes, dtype=float)
+
+    isQuiet = power < (average / 2.5)
+    isOutlier = (power > (average / 2.5)) & (power < (average / 1.3))
+    isSharp = power > (average / 1.3)
+
+    quietFrames = numpy.flatnonzero(isQuiet)
+    outlierFrames = numpy.flatnonzero(isOutlier)
+    sharpFrames = numpy.flatnonzero(isSharp)
+
+    quietBefore = numpy.concatenate(([0], numpy.cumsum(isQuiet)))
+    outliersBefore = numpy.concatenate(([0], numpy.cumsum(isOutlier)))
+    sharpBefore = numpy.concatenate(([0], numpy.cumsum(isSharp)))
+
+    # Where the scan starting at each quiet frame stops: just after its sixth
+    # outlier or at its second sharp outlier, with the end of the track
+    # standing in for outliers that never come
+    starts = quietFrames
+    afterOutlier = numpy.append(outlierFrames + 1, numFrames)
+    atSharp = numpy.append(sharpFrames, numFrames)
+    sixthOutlier = numpy.minimum(outliersBefore[starts] + 5, len(outlierFrames))
+    secondSharp = numpy.minimum(sharpBefore[starts] + 1, len(sharpFrames))
+    ends = numpy.minimum(starts + 25, numFrames)
+    ends = numpy.minimum(ends, afterOutlier[sixthOutlier])
+    ends = numpy.minimum(ends, atSharp[secondSharp])
+
+    # Do not count 'outliers' that came at the occlusion. Outliers are
+    # only sound in the middle of the occlusion
+    outliers = outliersBefore[ends] - outliersBefore[starts]
+    numFalseOutliers = quietBefore[ends] - quietBefore[ends - outliers]
+    lengths = ends - starts - numFalseOutliers
+
+    # A scan resumes after the frame that stopped the previous one
+    scanned = []
+    nextFrame = 0
+    while True:
+        occlusion = numpy.searchsorted(quietFrames, nextFrame)
+        if occlusion == len(quietFrames):
+            break
+        scanned.append(occlusion)
+        nextFrame = ends[occlusion] + 1
+    scanned = numpy.array(scanned, dtype=int)
+
+    starts = starts[scanned]
+    stops = ends[scanned] - numFalseOutliers[scanned]
+    lengths = lengths[scanned]
+
+    candidates = numpy.flatnonzero((lengths <= 30) & (lengths >= 8))
+    if len(candidates) > 0 and stops[candidates[-1]] == numFrames:
+        # An occlusion running into the end of the track has no end time,
+        # which only matters once a pulse or minimum is compared against it
+        last = candidates[-1]
+        laterPulses = numpy.count_nonzero(pulseTimes > times[starts[last]])
+        if laterPulses > 0 or (lengths[last] // 10 == 0 and len(minima) > 0):
+            raise IndexError("occlusion runs past the end of the spectral track")
+        candidates = candidates[:-1]
+
+    startTimes = times[starts[candidates]]
+    stopTimes = times[stops[candidates]]
+
+    numPulsesInRange = numpy.searchsorted(pulseTimes, stopTimes, side='left') - numpy.searchsorted(pulseTimes, startTimes, side='right')
+    withPulses = candidates[numpy.maximum(numPulsesInRange, 0) >= lengths[candidates] // 10]
+
+    startTimes = times[starts[withPulses]]
+    stopTimes = times[stops[withPulses]]
+    firstMinimum = numpy.searchsorted(minima.times, startTimes, side='right')
+    hasMinimum = firstMinimum < numpy.searchsorted(minima.times, stopTimes, side='left')
+
+    if numpy.count_nonzero(hasMinimum) == 1:
         if logger != None:
+            tap = numpy.flatnonzero(hasMinimum)[0]
+            tapStart = startTimes[tap]
+            tapEnd = stopTimes[tap]
+
+            # Report the minimum last looked at and the length of the last
+            # occlusion scanned, as the original loop did
+            occlusionMinimum = None
+            if len(withPulses) > 0 and len(minima) > 0:
+                if hasMinimum[-1]:
+                    occlusionMinimum = minima[firstMinimum[-1]]
+                else:
+                    occlusionMinimum = minima[-1]
+
             logger.write("tap found\n")
-            logger.write(f"occlusion minima: {min}\n")
-            logger.write(f"occlusion length: {j*0.002}\n")
+            logger.write(f"occlusion minima: {occlusionMinimum}\n")
+            logger.write(f"occlusion length: {lengths[-1]*SPECTRAL_TIME_STEP}\n")
             logger.write(f"occlusion midpoint: {(tapStart + tapEnd) / 2}\n")
+
+            logMeasurement(logger, "occlusionStart", tapStart)
+            logMeasurement(logger, "occlusionEnd", tapEnd)
+            logMeasurement(logger, "occlusionMidpoint", (tapStart + tapEnd) / 2)
+            logMeasurement(logger, "occlusionLength", lengths[withPulses[tap]] * SPECTRAL_TIME_STEP)
+            logMeasurement(logger, "occlusionIntensityMinimum", minima.values[firstMinimum[tap]])
         return TAP
     else:
         if logger != None:
             logger.write("no tap or trill found \n")
         return OTHER
 
-def getSpectralPowerList(sound, duration):
-    spectralPowerList = []
-    spectrogram = sound.to_spectrogram()
-
-    i = 0
-    while i < duration:
-        power = spectrogram.to_spectrum_slice(i).get_band_energy()
-        spectralPowerList.append((power, i))
-        
-        i += 0.002
-    
-    return spectralPowerList
-
-def trimSpectralPowerList(spectralPowerList):
-    # Omit initial silence
-    for i, cur in enumerate(spectralPowerList):
-        if cur[0] > 20:
-            break
-    trimmedList = spectralPowerList[i:]
+# Mean of the 5 values centred on each of frames, along with whether each
+# window lies within values. Negative indices count back from the end.
+def getWindowMeans(values, frames):
+    windows = frames[:, numpy.newaxis] + numpy.arange(-2, 3)
+    isValid = ((windows >= -len(values)) & (windows < len(values))).all(axis=1)
 
-    # Now omit end silence
-    for i in range(len(trimmedList)-1, 0, -1):
-        if trimmedList[i][0] > 20:
-            break
-    trimmedList = trimmedList[:i]
+    window = values[numpy.clip(windows, -len(values), len(values) - 1)]
 
-    return trimmedList
+    # Add up each window left to right, as a running tally would
+    total = window[:, 0] + window[:, 1]
+    for j in range(2, 5):
+        total += window[:, j]
 
-def findAllLocalMinima(durationList):
-    minima = []
-    
-    for i in range(16, len(durationList) - 16):
-        if durationList[i][0] < durationList[i-1][0] and durationList[i][0] < durationList[i+1][0]:
-            if ((((durationList[i - 20][0] - durationList[i][0]) + (durationList[i + 20][0] - durationList[i][0])) / 2) > 0.6
-                and durationList[i - 8][0] > durationList[i][0] and durationList[i + 8][0] > durationList[i][0]):
-                #smoothedMin = True
-                #for j in range(2, 10):
-                #    if not (durationList[i][0] < durationList[i-j][0] and durationList[i][0] < durationList[i+j][0]):
-                #        smoothedMin = False
-                #        break
-                #if smoothedMin:
-                    minima.append(durationList[i])
-    
-    return minima
-
-def checkForTrill(minima, spectralPowerList, logger):
-    for i in range(len(minima) - 1):
-        if minima[i+1][1] - minima[i][1] < .06:
-            indexIntoSpectralList1 = trunc((minima[i][1] - spectralPowerList[0][1]) / 0.002)
-            spectralPowerTally1 = 0
-            for j in range(5):
-                spectralPowerTally1 += spectralPowerList[indexIntoSpectralList1 - 2 + j][0]
-            spectralPowerTally1 /= 5
-
-            indexIntoSpectralList2 = trunc((minima[i+1][1] - spectralPowerList[0][1]) / 0.002)
-            spectralPowerTally2 = 0
-            for j in range(5):
-                spectralPowerTally2 += spectralPowerList[indexIntoSpectralList2 - 2 + j][0]
-            spectralPowerTally2 /= 5
-
-            indexIntoSpectralList3 = (indexIntoSpectralList1 + indexIntoSpectralList2) // 2
-            spectralPowerTally3 = 0
-            for j in range(5):
-                spectralPowerTally3 += spectralPowerList[indexIntoSpectralList3 - 2 + j][0]
-            spectralPowerTally3 /= 5
-
-            if ((spectralPowerTally1 + spectralPowerTally2) / 2) < (spectralPowerTally3 / 2):
-                if logger != None:
-                    logger.write("trill found\n")
-                    logger.write(f"first occlusions: {minima[i][1]}, {minima[i+1][1]}" + "\n")
-                return TRILL
-    
-    return None
+    return total / 5, isValid
 
-def findAndAnalyze(filename, target, logger=None):
+# Classify the rhotic in targetWord as said in the wave file filename.
+# Any exception along the way, including cancellation, means no tap or trill
+# is reported. With analysisCache, an analysisCache.AnalysisCache, the words
+# and tracks computed before for the same audio are reused.
+def findAndAnalyze(filename, target, logger=None, words=None, sentence=None, wordFile=None, cancelled=None, analysisCache=None):
     try:
-        newFile = isolateWord(filename, target, logger)
-        if newFile != None:
-            return analyzeWord(newFile, logger)
-        else:
-            if logger != None:
-                logger.write("no tap or trill found\n")
-            return OTHER
+        with instrumentation.span("decode") as decodeSpan:
+            samples, framerate = readWave(filename)
+            decodeSpan.set(samples=len(samples), rate=framerate)
     except:
         if logger != None:
             logger.write("no tap or trill found\n")
         return OTHER
 
-#analyzeWord("isolatedtest1.wav")
\ No newline at end of file
+    return analyzeRecording(samples, framerate, target, logger, words, sentence, wordFile, cancelled, analysisCache)
+
+# Classify the rhotic in targetWord as said in a recording already decoded
+# into samples. The word is analyzed straight from memory; wordFile is the
+# name to save a copy of the isolated word under, or None to not save one.
+def analyzeRecording(samples, framerate, target, logger=None, words=None, sentence=None, wordFile=None, cancelled=None, analysisCache=None):
+    with instrumentation.span("analysis", target=target, samples=len(samples)) as analysisSpan:
+        try:
+            wordSamples = isolateWord(samples, framerate, target, logger, words, sentence, analysisCache)
+            checkCancelled(cancelled)
+            if wordSamples is not None:
+                if wordFile != None:
+                    writeWave(wordFile, wordSamples, framerate)
+                result = analyzeWordSamples(wordSamples, framerate, logger, cancelled, analysisCache)
+            else:
+                if logger != None:
+                    logger.write("no tap or trill found\n")
+                result = OTHER
+        except:
+            if logger != None:
+                logger.write("no tap or trill found\n")
+            result = OTHER
+
+        analysisSpan.setOutcome("cancelled" if cancelled != None and cancelled.is_set() else result)
+        return result
+
+# Classify the rhotic in a recording that is already just the target word,
+# such as the isolated clips kept in study archives.
+def analyzeIsolatedWord(samples, framerate, target, logger=None, analysisCache=None):
+    if logger != None:
+        logger.write("\t" + target + "\n")
+
+    with instrumentation.span("analysis", target=target, samples=len(samples)) as analysisSpan:
+        try:
+            result = analyzeWordSamples(samples, framerate, logger, analysisCache=analysisCache)
+        except:
+            if logger != None:
+                logger.write("no tap or trill found\n")
+            result = OTHER
+
+        analysisSpan.setOutcome(result)
+        return result
+
+# Classify the rhotic in a word's samples with analyzeWord, starting from the
+# tracks analysisCache kept for the same samples, if it is given, and
+# keeping any computed here for next time.
+def analyzeWordSamples(wordSamples, framerate, logger=None, cancelled=None, analysisCache=None):
+    if analysisCache == None:
+        return analyzeWord(toSound(wordSamples, framerate), logger, cancelled=cancelled)
+
+    features = analysisCache.getFeatures(wordSamples, framerate)
+    try:
+        return analyzeWord(toSound(wordSamples, framerate), logger, features, cancelled)
+    finally:
+        analysisCache.putFeatures(features)
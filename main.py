@@ -1,11 +1,16 @@
 import tkinter
 from tkinter import ttk
 import threading
-import time
+import analysisPool
+import audioEngine
 import createRecording
+import measurementLog
+import recognition
+import referenceIndex
+import studyArchive
+import uiThread
+from sentences import NATIVE_SPEAKER_VOICE_SAMPLES, SENTENCE_SAMPLES, TARGET_WORDS
 import os
-import re
-import zipfile
 
 TUTORIAL_INTRO = "Thank you for participating in this study!"
 TUTORIAL_OVERVIEW = "The subject of this study is the Spanish 'r' sound. To participate, this \
@@ -25,40 +30,16 @@ FINAL_RECORD_INSTRUCTION = """Please record the sentence again up to 3 times. St
 satisfied with your last recording. Only the last recording will be used. You do not need to use \
 all 3 attempts. Click → when finished."""
 END_SCREEN_INSTRUCTION = "Thank you very much for participating in this study! You may now close the window."
-NATIVE_SPEAKER_VOICE_SAMPLES = ["voiceExamples/rec1.wav", "voiceExamples/rec2.wav",
-"voiceExamples/rec3.wav", "voiceExamples/rec4.wav", "voiceExamples/rec5.wav", "voiceExamples/rec6.wav",
-"voiceExamples/rec7.wav", "voiceExamples/rec8.wav", "voiceExamples/rec9.wav", "voiceExamples/rec10.wav",
-"voiceExamples/rec11.wav", "voiceExamples/rec12.wav", "voiceExamples/rec13.wav", "voiceExamples/rec14.wav",
-"voiceExamples/rec15.wav", "voiceExamples/rec16.wav", "voiceExamples/rec17.wav", "voiceExamples/rec18.wav",
-"voiceExamples/rec19.wav", "voiceExamples/rec20.wav"]
-SENTENCE_SAMPLES = ["Tengo muchas comidas para mi familia.",
-"Hay topacio y oro en el anillo.",
-"Hay un zorro muy bonito nadando en la playa.",
-"Todos quisimos un perro como mascota.",
-"Corro dos millas todos los días.",
-"El carro de mi tío es azul y blanco.",
-"Daniel tocaba la guitarra en la banda.",
-"Necesito que la caja sea duro.",
-"La mostaza es un condimento horrible en la pizza.",
-"Hay una gorra azul de tu talla en la mesa.",
-"Quiero lechuga y tomate en mi sándwich.",
-"El toro está comiendo heno.",
-"La mamá mira a su hijo en el tobogán.",
-"Mi gato Felix es muy curioso.",
-"Me gustaba mi tiempo en el coro de mi colegio.",
-"Dibujo algo nuevo en la pizarra cada semana.",
-"Veo una jarra llena de limonada.",
-"El juego fue muy caro así que no fuimos.",
-"La candela tiene un buen aroma.",
-"Veo la cara de una niña en la foto."]
-TARGET_WORDS = ["para", "oro", "zorro", "perro", "corro", "carro", "guitarra", "duro",
-"horrible", "gorra", "quiero", "toro", "mira", "curioso", "coro", "pizarra", "jarra",
-"caro", "aroma", "cara"]
 DATA_DIRECTORY = "Please_Send_This_File"
-LOG_FILE = "measurementsLog.txt"
-logfile = None
-
-# Build the original window and dedicate the main thread to mainloop()
+LOG_FILE = "measurementsLog.jsonl"
+ARCHIVE_CODEC = "deflate" # One of studyArchive.ARCHIVE_CODECS
+ARCHIVE_CLOSE_SECONDS = 60 # Longest to wait at exit for the archive to be written
+logfile = None # measurementLog.MeasurementLog of the study, once it starts
+dataArchive = None # studyArchive.ArchiveWriter of the study, once it starts
+
+# Build the original window and dedicate the main thread to mainloop().
+# The study moves from screen to screen in callbacks run by the main loop, so
+# nothing ever waits on a thread or polls.
 def main():
     root = tkinter.Tk()
     root.config(padx=40, pady=20)
@@ -69,31 +50,51 @@ def main():
     
     root.geometry("800x800")
 
-    threading.Thread(target=buildWindow, args=(root,)).start()
+    # Load the speech model, open the sound device and read the native
+    # speaker references while the participant reads the tutorial
+    recognition.MODEL_REGISTRY.warm()
+    audioEngine.AUDIO_ENGINE.warm()
+    referenceIndex.REFERENCE_INDEX.warm()
+
+    # Recording, playback and analysis threads hand widget updates to this thread
+    uiThread.UI.attach(root)
+
+    buildWindow(root)
 
     root.mainloop()
 
+    closeStudyData()
+
+    recognition.MODEL_REGISTRY.unload()
+    audioEngine.AUDIO_ENGINE.close()
+
+    # TODO Remove all .wav files
+    os._exit(0)
+
+# Close the log and the data archive, whether the study finished or the
+# window was closed part way through. The takes of finished sentences have
+# already been moved into the archive, so it is always closed with the log
+# added, and written out before the program exits.
+def closeStudyData():
     try:
         logfile.close()
     except:
         pass
 
-    # TODO Remove all .wav files
-    os._exit(0)
+    if dataArchive != None:
+        if not dataArchive.closing:
+            dataArchive.add(LOG_FILE, delete=False)
+            dataArchive.close()
+        dataArchive.wait(ARCHIVE_CLOSE_SECONDS)
 
 # Build a new frame for every phrase
 def buildWindow(root):
-    makeTutorial(root)
-
-    makePrimaryStudyLoop(root)
-    
-    buildZippedDataFile()
-
-    makeEndScreen(root)
+    makeTutorial(root, lambda: makePrimaryStudyLoop(root, lambda: makeEndScreen(root)))
 
 # Build a screen that provides instructions for the experiment and provides
-# two record buttons to test the audio recording functionality
-def makeTutorial(parentFrame):
+# two record buttons to test the audio recording functionality. onDone is
+# called once the participant moves on.
+def makeTutorial(parentFrame, onDone):
     curFrame = ttk.Frame(parentFrame, padding=(0,0,0,18))
     curFrame.pack(fill=tkinter.BOTH)
 
@@ -112,71 +113,110 @@ def makeTutorial(parentFrame):
     buildRecordButton(buttonFrame, "testButton1")
     buildRecordButton(buttonFrame, "testButton2")
 
-    buildNextButton(curFrame)
+    def finishTutorial():
+        # Delete uneeded files if they were created
+        try:
+            os.remove("testButton1.wav")
+        except:
+            pass
 
-    # Delete uneeded files if they were created
-    try:
-        os.remove("testButton1.wav")
-    except:
-        pass
+        try:
+            os.remove("testButton2.wav")
+        except:
+            pass
 
-    try:
-        os.remove("testButton2.wav")
-    except:
-        pass
+        curFrame.grid_forget()
+        curFrame.destroy()
+        onDone()
 
-    curFrame.grid_forget()
-    curFrame.destroy()
+    buildNextButton(curFrame, onDone=finishTutorial)
 
 # Build the series of screens that record the speaker pronouncing
-# the given sentences.
-def makePrimaryStudyLoop(root):
+# the given sentences, one after another, then call onDone. Each sentence's
+# final takes are added to the data archive in the background as soon as the
+# participant moves on, so only the log is left to add at the end.
+def makePrimaryStudyLoop(root, onDone):
+    global logfile, dataArchive
+
     instruction = ttk.Label(root, text=FIRST_RECORD_INSTRUCTION)
     instruction.pack(fill=tkinter.BOTH)
 
-    logFile = open(LOG_FILE, 'w')
+    logFile = measurementLog.MeasurementLog(LOG_FILE)
+    archive = studyArchive.ArchiveWriter(DATA_DIRECTORY + ".zip", ARCHIVE_CODEC)
+    logfile = logFile
+    dataArchive = archive
+
+    def showSentence(i):
+        if i >= len(TARGET_WORDS) - 15:
+            # Let the last analyses finish logging before the log is closed
+            analysisPool.ANALYSIS_POOL.whenIdle(lambda: uiThread.UI.call(finishLoop))
+            return
 
-    for i in range(len(TARGET_WORDS) -15):
         parentFrame = ttk.Frame(root)
         parentFrame.pack(fill=tkinter.BOTH)
-        makeFrame(parentFrame, SENTENCE_SAMPLES[i], TARGET_WORDS[i], NATIVE_SPEAKER_VOICE_SAMPLES[i], f"sentence{i}", logFile)
-        parentFrame.grid_forget()
-        parentFrame.destroy()
-    
-    logFile.close()
 
-    instruction.forget()
+        def finishSentence():
+            parentFrame.grid_forget()
+            parentFrame.destroy()
+            archiveSentence(archive, TARGET_WORDS[i], f"sentence{i}")
+            showSentence(i + 1)
 
-# Create a single frame to record the phrase, listen to a native speaker's
-# pronounciation, and then rerecord.
-def makeFrame(parentFrame, sampleSentence, targetWord, exampleSpeechFile, soundFilePrefix, logFile):
-    feedbackLabel = buildRecordAndListenBlock(parentFrame, sampleSentence, targetWord, exampleSpeechFile, soundFilePrefix + "rec1", logFile)
+        makeFrame(parentFrame, SENTENCE_SAMPLES[i], TARGET_WORDS[i], NATIVE_SPEAKER_VOICE_SAMPLES[i], f"sentence{i}", logFile, finishSentence)
+
+    def finishLoop():
+        logFile.close()
+        archive.add(LOG_FILE, delete=False)
+        instruction.forget()
+        archive.close(onClosed=lambda: uiThread.UI.call(onDone))
 
+    showSentence(0)
+
+# Create a single frame to record the phrase, listen to a native speaker's
+# pronounciation, and then rerecord. Each block is built once the one before
+# it is done, and onDone is called when the participant moves on.
+def makeFrame(parentFrame, sampleSentence, targetWord, exampleSpeechFile, soundFilePrefix, logFile, onDone):
     soundFileNames = [soundFilePrefix + "rec2", soundFilePrefix + "rec3", soundFilePrefix + "rec4"]
-    buildFinalRecordings(parentFrame, targetWord, soundFileNames, feedbackLabel, logFile)
 
-    buildNextButton(parentFrame, (targetWord, soundFilePrefix))
+    def buildRetakes(feedbackLabel):
+        buildFinalRecordings(parentFrame, sampleSentence, targetWord, soundFileNames, feedbackLabel, logFile,
+            lambda: buildNextButton(parentFrame, (targetWord, soundFilePrefix), onDone))
+
+    buildRecordAndListenBlock(parentFrame, sampleSentence, targetWord, exampleSpeechFile, soundFilePrefix + "rec1", logFile, buildRetakes)
+
+# Calls onDone the first time every one of names has been played.
+class PlaybackTracker:
+    def __init__(self, names, onDone):
+        self.waiting = set(names) # Names not yet played
+        self.onDone = onDone
+
+    def played(self, name):
+        if name in self.waiting:
+            self.waiting.remove(name)
+            if len(self.waiting) == 0:
+                self.onDone()
 
 # Provide button to record a phrase, and once recorded, provide button
-# to listen to a native speaker's pronounciation.
-def buildRecordAndListenBlock(parentFrame, sampleSentence, targetWord, exampleSpeechFile, soundFileName, logFile):
-    wasPlayed = threading.Event()
+# to listen to a native speaker's pronounciation. Once both the recording
+# and the native speaker have been played, onDone is called with the
+# label that shows feedback on the recording.
+def buildRecordAndListenBlock(parentFrame, sampleSentence, targetWord, exampleSpeechFile, soundFileName, logFile, onDone):
+    feedbackLabel = None
 
-    feedbackLabel = buildRecordBlock(parentFrame, wasPlayed, sampleSentence, targetWord, soundFileName, logFile)
-    buildListenBlock(parentFrame, wasPlayed, exampleSpeechFile)
-    return feedbackLabel
+    tracker = PlaybackTracker(["user", "native"], lambda: onDone(feedbackLabel))
+
+    feedbackLabel = buildRecordBlock(parentFrame, lambda: tracker.played("user"), sampleSentence, targetWord, soundFileName, logFile,
+        lambda: buildListenBlock(parentFrame, lambda: tracker.played("native"), exampleSpeechFile))
 
 # Provide a button to record a phrase. First press begins recording,
 # second ends recording, and subsequent presses play recording back.
-def buildRecordBlock(grandParentFrame, wasPlayedUser, sampleSentence, targetWord, soundFileName, logFile):
+# onRecorded is called once the recording is saved.
+def buildRecordBlock(grandParentFrame, onPlayedUser, sampleSentence, targetWord, soundFileName, logFile, onRecorded):
     parentFrame = ttk.Frame(grandParentFrame, padding=(0,0,0,18))
     parentFrame.pack(fill=tkinter.BOTH)
 
     curFrame = ttk.Frame(parentFrame)
     curFrame.pack(fill=tkinter.BOTH)
 
-    wasRecorded = threading.Event()
-
     currentPhrase = ttk.Label(curFrame, text=sampleSentence, font=('Verdana', 12, "italic"))
     currentPhrase.pack(side=tkinter.TOP, fill=tkinter.BOTH)
 
@@ -186,45 +226,33 @@ def buildRecordBlock(grandParentFrame, wasPlayedUser, sampleSentence, targetWord
     feedbackLabel = ttk.Label(feedBackFrame)
     feedbackLabel.pack(side=tkinter.LEFT)
 
-    buildRecordButton(curFrame, soundFileName, targetWord=targetWord, wasRecorded=wasRecorded, wasPlayed=wasPlayedUser, feedback=feedbackLabel, logFile=logFile)
-
-    wasRecorded.wait()
+    buildRecordButton(curFrame, soundFileName, targetWord=targetWord, onRecorded=onRecorded, onPlayed=onPlayedUser, feedback=feedbackLabel, logFile=logFile, sentence=sampleSentence)
 
     return feedbackLabel
 
-# Create a button that plays a file on click.
-def buildListenBlock(parentFrame, wasPlayedUser, fileName):
+# Create a button that plays a file on click, calling onPlayed each time it
+# has been played.
+def buildListenBlock(parentFrame, onPlayed, fileName):
     curFrame = ttk.Frame(parentFrame, padding=(0,0,0,18))
     curFrame.pack(fill=tkinter.BOTH)
 
-    wasPlayedNative = threading.Event()
-
     instruction = ttk.Label(curFrame, text=LISTEN_BACK_INSTRUCTION)
     instruction.pack(side=tkinter.TOP, fill=tkinter.BOTH)#grid(column=0, row=3, sticky=tkinter.W)
 
-    button = ttk.Button(curFrame, text="Listen", command=lambda: threading.Thread(target=playFile, args=(fileName, label, wasPlayedNative)).start())
+    button = ttk.Button(curFrame, text="Listen", command=lambda: threading.Thread(target=playFile, args=(fileName, label, onPlayed)).start())
     button.pack(side=tkinter.LEFT)#grid(column=0, row=4, sticky=tkinter.W)
 
     label = ttk.Label(curFrame, text="0:00")
     label.pack(side=tkinter.LEFT)#grid(column=1, row=4, sticky=tkinter.W)
 
-    # Ensure that user recording and native recording have both been played before
-    while True:
-        if (wasPlayedUser.is_set()):
-            wasPlayedNative.wait()
-            break
-        elif (wasPlayedNative.is_set()):
-            wasPlayedUser.wait()
-            break
-        time.sleep(0.001)
-
-def playFile(fileName, label, wasPlayed):
-    createRecording.CreateRecording.playFileAudio(fileName, label, wasPlayed=wasPlayed)
+def playFile(fileName, label, onPlayed):
+    createRecording.CreateRecording.playFileAudio(fileName, label, onPlayed=onPlayed)
 
 # Create three buttons to record voice samples. Each subsequent button is only
 # available after the previous has been pressed. Once a recording is made,
-# subsequent presses play the recording back.
-def buildFinalRecordings(parentFrame, targetWord, soundFileNames, feedbackLabel, logFile):
+# subsequent presses play the recording back. onDone is called once the
+# first of them has been recorded.
+def buildFinalRecordings(parentFrame, sampleSentence, targetWord, soundFileNames, feedbackLabel, logFile, onDone):
     threeTriesFrame = ttk.Frame(parentFrame, padding=(0,0,0,18))
     threeTriesFrame.pack(fill=tkinter.BOTH)#grid(column=0, row=6, sticky=tkinter.W)
 
@@ -244,79 +272,77 @@ def buildFinalRecordings(parentFrame, targetWord, soundFileNames, feedbackLabel,
         recordLabels.append(ttk.Label(frame))
         recordLabels[i].pack(side=tkinter.LEFT, fill=tkinter.BOTH)
 
-    oneRecordingDone = threading.Event()
-
-    createRecording.CreateRecording(buttons[0], recordLabels[0], soundFileNames[0], targetWord=targetWord, wasRecorded=oneRecordingDone, nextButton=buttons[1], feedback=feedbackLabel, logFile=logFile)
-    createRecording.CreateRecording(buttons[1], recordLabels[1], soundFileNames[1], targetWord=targetWord, nextButton=buttons[2], feedback=feedbackLabel, logFile=logFile)
-    createRecording.CreateRecording(buttons[2], recordLabels[2], soundFileNames[2], targetWord=targetWord, feedback=feedbackLabel, logFile=logFile)
-
-    oneRecordingDone.wait()
-
-# Build a button to exit this frame and build the next when pressed.
-def buildNextButton(parentFrame, fileToDelete=None):
-    endFrame = threading.Event()
-
-    nextButton = ttk.Button(parentFrame, text="→", command=endFrame.set)
+    createRecording.CreateRecording(buttons[0], recordLabels[0], soundFileNames[0], targetWord=targetWord, onRecorded=onDone, nextButton=buttons[1], feedback=feedbackLabel, logFile=logFile, sentence=sampleSentence)
+    createRecording.CreateRecording(buttons[1], recordLabels[1], soundFileNames[1], targetWord=targetWord, nextButton=buttons[2], feedback=feedbackLabel, logFile=logFile, sentence=sampleSentence)
+    createRecording.CreateRecording(buttons[2], recordLabels[2], soundFileNames[2], targetWord=targetWord, feedback=feedbackLabel, logFile=logFile, sentence=sampleSentence)
+
+# Build a button to exit this frame and build the next when pressed. Once
+# pressed, the takes replaced by later ones are deleted and onDone is called.
+def buildNextButton(parentFrame, fileToDelete=None, onDone=None):
+    def pressed():
+        nextButton.config(state=tkinter.DISABLED)
+
+        if fileToDelete == None:
+            finish()
+        else:
+            # Wait for the last take's isolated word to be saved
+            analysisPool.ANALYSIS_POOL.whenIdle(lambda: uiThread.UI.call(finish))
+
+    def finish():
+        if fileToDelete != None:
+            deleteReplacedTakes(fileToDelete)
+        if onDone != None:
+            onDone()
+
+    nextButton = ttk.Button(parentFrame, text="→", command=pressed)
     nextButton.pack(side=tkinter.RIGHT)#grid(column=2, row=6, sticky=tkinter.W)
 
-    endFrame.wait()
-
-    if fileToDelete != None:
-        finalRecordings = []
-        finalRecordings.append(fileToDelete[0] + "-only" + fileToDelete[1] + "rec4.wav")
-        finalRecordings.append(fileToDelete[1] + "rec4.wav")
-        finalRecordings.append(fileToDelete[0] + "-only" + fileToDelete[1] + "rec3.wav")
-        finalRecordings.append(fileToDelete[1] + "rec3.wav")
-        finalRecordings.append(fileToDelete[0] + "-only" + fileToDelete[1] + "rec2.wav")
-        finalRecordings.append(fileToDelete[1] + "rec2.wav")
-
-        firstRecordingWordIsolated = fileToDelete[0] + "-only" + fileToDelete[1] + "rec1.wav"
-        firstRecording = fileToDelete[1] + "rec1.wav"
-
-        if os.path.exists(firstRecordingWordIsolated):
-            os.remove(firstRecording)
+# Delete every recording of the sentence but the last, keeping just the
+# isolated word of a take where there is one. fileToDelete is the sentence's
+# (target word, file prefix).
+def deleteReplacedTakes(fileToDelete):
+    finalRecordings = []
+    finalRecordings.append(fileToDelete[0] + "-only" + fileToDelete[1] + "rec4.wav")
+    finalRecordings.append(fileToDelete[1] + "rec4.wav")
+    finalRecordings.append(fileToDelete[0] + "-only" + fileToDelete[1] + "rec3.wav")
+    finalRecordings.append(fileToDelete[1] + "rec3.wav")
+    finalRecordings.append(fileToDelete[0] + "-only" + fileToDelete[1] + "rec2.wav")
+    finalRecordings.append(fileToDelete[1] + "rec2.wav")
+
+    firstRecordingWordIsolated = fileToDelete[0] + "-only" + fileToDelete[1] + "rec1.wav"
+    firstRecording = fileToDelete[1] + "rec1.wav"
+
+    if os.path.exists(firstRecordingWordIsolated):
+        os.remove(firstRecording)
+
+    for i in range(len(finalRecordings)):
+        if os.path.exists(finalRecordings[i]):
+            for j in range(i+1, len(finalRecordings)):
+                try:
+                    os.remove(finalRecordings[j])
+                except:
+                    pass
 
-        for i in range(len(finalRecordings)):
-            if os.path.exists(finalRecordings[i]):
-                for j in range(i+1, len(finalRecordings)):
-                    try:
-                        os.remove(finalRecordings[j])
-                    except:
-                        pass
+# Queue the takes of a sentence that deleteReplacedTakes() kept, and the
+# words isolated from them, to be moved into the data archive.
+def archiveSentence(archive, targetWord, soundFilePrefix):
+    for take in range(1, 5):
+        recording = soundFilePrefix + "rec" + str(take) + ".wav"
+        for fileName in (targetWord + "-only" + recording, recording):
+            if os.path.exists(fileName):
+                archive.add(fileName)
 
 # Build a button that records audio when first pressed,
 # stops recording when pressed again, and then on subsequent
 # presses plays back the audio.
-def buildRecordButton(parentFrame, filename, targetWord=None, wasRecorded=None, wasPlayed=None, nextButton=None, logFile=None, feedback=None):
+def buildRecordButton(parentFrame, filename, targetWord=None, onRecorded=None, onPlayed=None, nextButton=None, logFile=None, feedback=None, sentence=None):
     button = ttk.Button(parentFrame)
     button.pack(side=tkinter.LEFT)
 
     label = ttk.Label(parentFrame)
     label.pack(side=tkinter.LEFT)
 
-    createRecording.CreateRecording(button, label, filename, targetWord=targetWord, wasRecorded=wasRecorded, wasPlayed=wasPlayed, feedback=feedback, logFile=logFile)
-
-# Build a zip file containing all the speaker audio recordings
-# and the log file.
-def buildZippedDataFile():
-    # Compile all files to a single zip
-    regex = re.compile('.*sentence.*\.wav$')
-
-    # create a ZipFile object
-    with zipfile.ZipFile(DATA_DIRECTORY + ".zip", 'w', compression=zipfile.ZIP_LZMA) as zipObj:
-        # Iterate over all the files in directory
-        for file in os.listdir("."):
-            if regex.match(file):
-                # Add file to zip
-                zipObj.write(file)
-                # Delete file
-                try:
-                    os.remove(file)
-                except:
-                    pass # unknown error
-
-        # add log file
-        zipObj.write(LOG_FILE)
+    createRecording.CreateRecording(button, label, filename, targetWord=targetWord, onRecorded=onRecorded, onPlayed=onPlayed, feedback=feedback, logFile=logFile, sentence=sentence)
 
 def makeEndScreen(parentFrame):
     curFrame = ttk.Frame(parentFrame, padding=(0,0,0,18))
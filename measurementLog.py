@@ -0,0 +1,125 @@
+# A log of every analysis made during the study, one JSON object per line.
+# Each record gives the recording, its target word, the word the recognizer
+# matched, the classification and the numbers behind it, e.g.
+#
+#   {"file": "sentence3rec2.wav", "target": "perro", "word": "perro", "result": "trill",
+#    "measurements": {"wordStart": 1.02, "wordEnd": 1.5, "firstOcclusion": 0.21, ...}, ...}
+#
+# Analyses run on several threads at once, so records are queued under a lock
+# and written out in batches rather than line by line. A timer writes out a
+# batch that is still short BATCH_SECONDS after its first record, so a quiet
+# spell in the study doesn't leave records unwritten.
+
+import io
+import json
+import threading
+import time
+
+BATCH_SIZE = 8 # Records held before they are written out
+BATCH_SECONDS = 30 # Longest a record is held before being written out
+
+# Collects what one analysis finds. It can be passed to isolateSound as the
+# logger: the notes the analysis writes are kept as text, and the values it
+# measures with isolateSound.logMeasurement are kept by name.
+class AnalysisRecord:
+    def __init__(self, filename, target, sentence=None):
+        self.filename = filename # Recording analyzed
+        self.target = target # Word the rhotic was looked for in
+        self.sentence = sentence
+
+        self.word = None # Word the recognizer matched to target, if any
+        self.result = None # TRILL, TAP or OTHER once the analysis is done
+        self.measurements = {}
+        self.notes = io.StringIO()
+        self.time = time.time()
+
+    def write(self, text):
+        self.notes.write(text)
+
+    def measure(self, name, value):
+        if name == "word":
+            self.word = value
+        else:
+            self.measurements[name] = value
+
+    def setResult(self, result):
+        self.result = result
+
+    def toRecord(self):
+        return {
+            "time": self.time,
+            "file": self.filename,
+            "target": self.target,
+            "sentence": self.sentence,
+            "word": self.word,
+            "result": self.result,
+            "measurements": self.measurements,
+            "notes": self.notes.getvalue(),
+        }
+
+# Appends AnalysisRecords to a JSON lines file. Safe to share between
+# threads; close() writes out anything still held.
+class MeasurementLog:
+    def __init__(self, filename, batchSize=BATCH_SIZE, batchSeconds=BATCH_SECONDS):
+        self.outFile = open(filename, "w", encoding="utf-8")
+        self.batchSize = batchSize
+        self.batchSeconds = batchSeconds
+
+        self.lines = [] # Records not yet written, as JSON
+        self.timer = None # Writes out the held records batchSeconds after the first, while any are held
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record.toRecord(), ensure_ascii=False, default=float) + "\n"
+
+        with self.lock:
+            self.lines.append(line)
+            if len(self.lines) >= self.batchSize:
+                self.writeLines()
+            elif self.timer == None:
+                self.timer = threading.Timer(self.batchSeconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if not self.outFile.closed:
+                self.writeLines()
+
+    def close(self):
+        with self.lock:
+            if self.outFile.closed:
+                return
+            self.writeLines()
+            self.outFile.close()
+
+    # Write out the held records. Must be called with the lock held.
+    def writeLines(self):
+        if self.timer != None:
+            self.timer.cancel()
+            self.timer = None
+
+        if len(self.lines) > 0:
+            self.outFile.write("".join(self.lines))
+            self.outFile.flush()
+            self.lines = []
+
+# Yield each record in a measurement log one at a time, without reading the
+# whole log into memory. source is a filename or an open file, such as a
+# member of a study archive. A last line cut short by a crash is skipped.
+def readMeasurements(source):
+    if isinstance(source, str):
+        with open(source, encoding="utf-8") as logFile:
+            yield from readMeasurements(logFile)
+        return
+
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if line.strip() == "":
+            continue
+
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            continue
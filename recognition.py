@@ -0,0 +1,253 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+import numpy
+import vosk
+
+MODEL_PATH = "vosk-model-small-es-0.42"
+RECOGNIZER_RATE = 16000 # Sample rate the model was trained on
+RESAMPLER_TAPS = 63 # Length of the anti-aliasing filter used before resampling
+
+# Return the resident memory of this process in bytes, or None if it
+# can't be measured on this platform.
+def getResidentMemory():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# Process-wide owner of the Vosk model. The model is loaded from disk the
+# first time it is needed (or ahead of time with warm()) and shared by every
+# recognizer. Recognizers themselves are cheap and are created per call, since
+# a single KaldiRecognizer must not be fed from more than one thread.
+class ModelRegistry:
+    def __init__(self, modelPath=MODEL_PATH):
+        self.modelPath = modelPath # Directory of the unzipped Vosk model
+
+        self.model = None # Loaded vosk.Model, or None until first use
+        self.lock = threading.Lock() # Guards loading and unloading of the model
+
+        self.loadSeconds = None # Wall time of the last load
+        self.loadMemoryBytes = None # Growth in resident memory caused by the last load
+
+        self.warmThread = None
+
+    # Return the shared model, loading it if this is the first call.
+    def getModel(self):
+        with self.lock:
+            if self.model == None:
+                vosk.SetLogLevel(-1) # Disable debug messages
+
+                memoryBefore = getResidentMemory()
+                start = time.perf_counter()
+
+                self.model = vosk.Model(model_path=self.modelPath)
+
+                self.loadSeconds = time.perf_counter() - start
+                memoryAfter = getResidentMemory()
+                if memoryBefore != None and memoryAfter != None:
+                    self.loadMemoryBytes = memoryAfter - memoryBefore
+
+            return self.model
+
+    # Load the model on a background thread so the first recording
+    # doesn't pay for it. A load that fails here is tried again by the first
+    # getModel() call, which raises its error. The time and memory the load
+    # took are left for stats() and describe().
+    def warm(self):
+        with self.lock:
+            if self.model != None or (self.warmThread != None and self.warmThread.is_alive()):
+                return self.warmThread
+
+            self.warmThread = threading.Thread(target=self.warmModel, daemon=True)
+            self.warmThread.start()
+            return self.warmThread
+
+    def warmModel(self):
+        try:
+            self.getModel()
+        except Exception:
+            pass
+
+    # Create a new recognizer for one stream of audio at sampleRate. If a
+    # grammar from buildGrammar() is given, only its phrases are recognized.
+    def createRecognizer(self, sampleRate, grammar=None):
+        if grammar == None:
+            recognizer = vosk.KaldiRecognizer(self.getModel(), sampleRate)
+        else:
+            recognizer = vosk.KaldiRecognizer(self.getModel(), sampleRate, grammar)
+        recognizer.SetWords(True)
+        return recognizer
+
+    # Drop the shared model so its memory can be reclaimed. Recognizers
+    # still in use keep their own reference until they are finished.
+    def unload(self):
+        with self.lock:
+            self.model = None
+
+    def isLoaded(self):
+        return self.model != None
+
+    def stats(self):
+        return {
+            "modelPath": self.modelPath,
+            "loaded": self.isLoaded(),
+            "loadSeconds": self.loadSeconds,
+            "loadMemoryBytes": self.loadMemoryBytes,
+        }
+
+    def describe(self):
+        if self.loadSeconds == None:
+            return f"Vosk model {self.modelPath} not loaded"
+
+        description = f"Loaded Vosk model {self.modelPath} in {self.loadSeconds:.2f}s"
+        if self.loadMemoryBytes != None:
+            description += f" (+{self.loadMemoryBytes / (1024 * 1024):.1f} MB)"
+        return description
+
+MODEL_REGISTRY = ModelRegistry()
+
+# Return a recognizer grammar for someone reading sentence aloud. It allows
+# the whole sentence or any of its words in any order, so a misread or
+# partial take still decodes, plus "[unk]" for anything else that is said.
+# Restricting the search to these words makes decoding faster and the target
+# word far more likely to be recognized as itself.
+def buildGrammar(sentence, targetWord=None):
+    words = re.sub(r"[^\w\s]", " ", sentence.lower()).split()
+    if targetWord != None and targetWord.lower() not in words:
+        words.append(targetWord.lower())
+
+    phrases = [" ".join(words)]
+    for word in words:
+        if word not in phrases:
+            phrases.append(word)
+    phrases.append("[unk]")
+
+    return json.dumps(phrases, ensure_ascii=False)
+
+# Converts a stream of 16 bit mono PCM from one sample rate to another,
+# chunk by chunk. Audio is low-pass filtered below the new Nyquist frequency
+# and then linearly interpolated at the new sample times. Output sample k is
+# always taken at time k / outputRate, however the input is split up.
+class Resampler:
+    def __init__(self, inputRate, outputRate, taps=RESAMPLER_TAPS):
+        self.step = inputRate / outputRate # Input samples per output sample
+
+        # Windowed-sinc low-pass filter with its cutoff just under the
+        # output's Nyquist frequency (or the input's, when upsampling)
+        cutoff = 0.45 * min(inputRate, outputRate) / inputRate
+        offsets = numpy.arange(taps) - (taps - 1) / 2
+        self.filter = 2 * cutoff * numpy.sinc(2 * cutoff * offsets) * numpy.hamming(taps)
+        self.filter /= self.filter.sum()
+        self.delay = (taps - 1) / 2 # Input samples the filter delays the audio by
+
+        self.history = numpy.zeros(taps - 1) # Input carried over from the previous chunk
+        self.lastFiltered = 0.0 # Last filtered sample of the previous chunk
+        self.numFiltered = 0 # Filtered samples produced so far
+        self.numOutput = 0 # Output samples produced so far
+
+    def process(self, data):
+        samples = numpy.frombuffer(data, dtype=numpy.int16).astype(float)
+
+        padded = numpy.concatenate((self.history, samples))
+        filtered = numpy.convolve(padded, self.filter, mode='valid')
+        self.history = padded[len(padded) - len(self.history):]
+
+        # Keep the previous chunk's last sample to interpolate across the boundary
+        filtered = numpy.concatenate(([self.lastFiltered], filtered))
+        firstIndex = self.numFiltered - 1
+        self.numFiltered += len(samples)
+        self.lastFiltered = filtered[-1]
+
+        # Every output sample whose position lies before the last filtered sample
+        lastOutput = int(numpy.ceil((self.numFiltered - 1 - self.delay) / self.step))
+        positions = numpy.arange(self.numOutput, lastOutput) * self.step + self.delay - firstIndex
+        self.numOutput = max(self.numOutput, lastOutput)
+
+        below = numpy.floor(positions).astype(int)
+        fraction = positions - below
+        resampled = filtered[below] * (1 - fraction) + filtered[below + 1] * fraction
+
+        return numpy.clip(numpy.round(resampled), -32768, 32767).astype(numpy.int16).tobytes()
+
+# Recognizes one stream of audio and collects the words found in it, each a
+# dict with "word", "start", "end" and "conf" keys. Audio is given as raw
+# 16 bit mono PCM bytes at sampleRate, and is resampled to the model's own
+# rate before recognition. Word times are in seconds, so they apply to the
+# original audio unchanged. grammar optionally limits what can be recognized.
+class WordRecognizer:
+    def __init__(self, sampleRate, registry=MODEL_REGISTRY, grammar=None):
+        self.recognizer = registry.createRecognizer(RECOGNIZER_RATE, grammar)
+        self.words = []
+
+        self.resampler = None
+        if sampleRate != RECOGNIZER_RATE:
+            self.resampler = Resampler(sampleRate, RECOGNIZER_RATE)
+
+    def acceptAudio(self, data):
+        if self.resampler != None:
+            data = self.resampler.process(data)
+
+        # The recognizer returns True at the end of each utterance, and
+        # that utterance's words must be collected before it moves on
+        if self.recognizer.AcceptWaveform(data):
+            self.words.extend(json.loads(self.recognizer.Result()).get("result", []))
+
+    # Flush the last utterance and return every word recognized.
+    def finish(self):
+        self.words.extend(json.loads(self.recognizer.FinalResult()).get("result", []))
+        return self.words
+
+# A WordRecognizer fed while audio is still being captured. Audio is queued
+# and recognized on a background thread so the capture loop never waits on
+# the recognizer, and the words are ready as soon as capture stops.
+class StreamingRecognizer(WordRecognizer):
+    def __init__(self, sampleRate, registry=MODEL_REGISTRY, grammar=None):
+        WordRecognizer.__init__(self, sampleRate, registry, grammar)
+
+        self.chunks = queue.Queue() # Audio waiting to be recognized, None once capture ends
+        self.cancelled = False # True once the audio is no longer wanted
+
+        self.thread = threading.Thread(target=self.recognizeChunks, daemon=True)
+        self.thread.start()
+
+    def acceptAudio(self, data):
+        self.chunks.put(data)
+
+    def recognizeChunks(self):
+        data = self.chunks.get()
+        while data != None and not self.cancelled:
+            WordRecognizer.acceptAudio(self, data)
+            data = self.chunks.get()
+
+    # Wait for the queued audio to be recognized and return every word.
+    def finish(self):
+        self.chunks.put(None)
+        self.thread.join()
+        return WordRecognizer.finish(self)
+
+    # Stop recognizing without waiting for the audio still queued.
+    def cancel(self):
+        self.cancelled = True
+        self.chunks.put(None)
+
+# Recognize a whole recording already decoded into an array of 16 bit
+# samples, feeding it to the recognizer in chunks.
+def recognizeSamples(samples, sampleRate, chunkFrames=4000, grammar=None):
+    recognizer = WordRecognizer(sampleRate, grammar=grammar)
+
+    for start in range(0, len(samples), chunkFrames):
+        recognizer.acceptAudio(samples[start:start + chunkFrames].tobytes())
+
+    return recognizer.finish()
@@ -0,0 +1,203 @@
+# Measurements of the native speaker recordings in
+# NATIVE_SPEAKER_VOICE_SAMPLES, so a learner's take can be compared with the
+# native reading of the same word. The references are recognized and
+# analyzed once, by running this file, and kept in an index next to them:
+#
+#   python referenceIndex.py --model vosk-model-small-es-0.42
+#
+# The references are recognized without a grammar, as the study's takes are
+# unless createRecording.CONSTRAIN_RECOGNITION is turned on, so both word
+# boundaries come from the same decoder. Give --grammar to match takes
+# recognized with one; the index records which was used.
+#
+# For each target word the index holds where the word lies in its
+# recording, the band energy and intensity tracks of the word, the rhotic
+# found in it and the times of the occlusions found, all in seconds from
+# the start of the word. The study and batchAnalyze only ever read the
+# index; the references aren't analyzed while they run.
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+import numpy
+
+import analysisCache
+import isolateSound
+import measurementLog
+import recognition
+from sentences import NATIVE_SPEAKER_VOICE_SAMPLES, SENTENCE_SAMPLES, TARGET_WORDS
+
+REFERENCE_INDEX_FILE = "voiceExamples/referenceIndex.npz"
+INDEX_VERSION = 2 # Bump when what the index holds changes, so old ones are rebuilt
+OCCLUSION_MEASUREMENTS = ["occlusionStart", "occlusionEnd", "occlusionLength", "firstOcclusion", "secondOcclusion"]
+
+# What the index holds for the native reading of one target word.
+class NativeReference:
+    def __init__(self, target, filename, result, measurements, spectralTrack, intensityTrack):
+        self.target = target
+        self.filename = filename # Native speaker recording the word was found in
+        self.result = result # TRILL, TAP or OTHER, as analyzeWord classified it
+        self.measurements = measurements # By name, as the analysis logged them
+        self.spectralTrack = spectralTrack # Band energy of the word, untrimmed
+        self.intensityTrack = intensityTrack # Intensity of the word, every frame computed
+
+    def wordDuration(self):
+        return self.measurements["wordEnd"] - self.measurements["wordStart"]
+
+# Recognize and analyze the native speaker recording of target, read as
+# sentence, limiting recognition to the sentence's words with grammar.
+# Returns a NativeReference, or None if the word wasn't recognized.
+def analyzeReference(filename, target, sentence, grammar=False):
+    record = measurementLog.AnalysisRecord(filename, target, sentence)
+    samples, framerate = isolateSound.readWave(filename)
+
+    words = recognition.recognizeSamples(samples, framerate, grammar=recognition.buildGrammar(sentence, target) if grammar else None)
+    wordSamples = isolateSound.sliceWord(samples, framerate, target, words, record)
+    if wordSamples is None:
+        return None
+
+    sound = isolateSound.toSound(wordSamples, framerate)
+    features = {"intensityTrack": isolateSound.getIntensityTrack(sound)}
+    try:
+        result = isolateSound.analyzeWord(sound, record, features)
+    except Exception:
+        result = isolateSound.OTHER
+    if "spectralTrack" not in features:
+        features["spectralTrack"] = isolateSound.getSpectralPowerList(sound, sound.get_total_duration())
+
+    return NativeReference(target, filename, result, record.measurements, features["spectralTrack"], features["intensityTrack"])
+
+# Analyze every native speaker recording and write the index to filename.
+# Returns the target words whose recordings the word wasn't recognized in.
+def buildIndex(filename=REFERENCE_INDEX_FILE, grammar=False):
+    references = {}
+    missing = []
+    for recording, sentence, target in zip(NATIVE_SPEAKER_VOICE_SAMPLES, SENTENCE_SAMPLES, TARGET_WORDS):
+        reference = analyzeReference(recording, target, sentence, grammar)
+        if reference == None:
+            missing.append(target)
+        else:
+            references[target] = reference
+
+    writeIndex(filename, references, grammar)
+    return missing
+
+# The index is one .npz file. Its "index" entry is JSON describing each
+# reference and whether they were recognized with a grammar, and each
+# reference's tracks are stored under its target word.
+def writeIndex(filename, references, grammar=False):
+    description = {"version": INDEX_VERSION, "grammar": grammar, "references": {}}
+    features = {}
+    for target, reference in references.items():
+        description["references"][target] = {
+            "file": reference.filename,
+            "result": reference.result,
+            "measurements": reference.measurements,
+        }
+        features[target + ".spectralTrack"] = reference.spectralTrack
+        features[target + ".intensityTrack"] = reference.intensityTrack
+    features["index"] = numpy.array(json.dumps(description, ensure_ascii=False, default=float))
+
+    with open(filename, "wb") as indexFile:
+        indexFile.write(analysisCache.packFeatures(features))
+
+# Return the NativeReference of each target word in the index in filename.
+def readIndex(filename):
+    with open(filename, "rb") as indexFile:
+        features = analysisCache.unpackFeatures(indexFile.read())
+
+    description = json.loads(str(features["index"]))
+    if description.get("version") != INDEX_VERSION:
+        raise ValueError(f"{filename} is from an older version and must be rebuilt")
+
+    references = {}
+    for target, reference in description["references"].items():
+        references[target] = NativeReference(target, reference["file"], reference["result"], reference["measurements"],
+            features[target + ".spectralTrack"], features[target + ".intensityTrack"])
+    return references
+
+# The index, read from its file the first time a reference is asked for. A
+# missing index is treated as empty, so takes are still analyzed without
+# comparisons until it is built; one that can't be read is also reported.
+class ReferenceIndex:
+    def __init__(self, filename=REFERENCE_INDEX_FILE):
+        self.filename = filename
+        self.references = None # NativeReference of each target word, once read
+        self.lock = threading.Lock() # Guards reading the index
+
+        self.warmThread = None
+
+    def getReferences(self):
+        with self.lock:
+            if self.references == None:
+                try:
+                    self.references = readIndex(self.filename) if os.path.exists(self.filename) else {}
+                except Exception as error:
+                    print(f"No native speaker reference index: {error}", file=sys.stderr)
+                    self.references = {}
+            return self.references
+
+    # Return the NativeReference of target, or None if it isn't indexed.
+    def get(self, target):
+        return self.getReferences().get(target)
+
+    # Read the index on a background thread, so the first take doesn't wait
+    # for it.
+    def warm(self):
+        if self.warmThread == None:
+            self.warmThread = threading.Thread(target=self.getReferences, daemon=True)
+            self.warmThread.start()
+        return self.warmThread
+
+REFERENCE_INDEX = ReferenceIndex()
+
+# How a learner's take of reference's word differs from the native reading,
+# given the measurements analyzing the take logged. Each difference is the
+# learner's value less the native one, in milliseconds, and is only given
+# where both were measured. Occlusion times are from the start of the word.
+def compareMeasurements(reference, measurements):
+    comparison = {"nativeResult": reference.result}
+
+    if "wordStart" in measurements and "wordEnd" in measurements:
+        wordDuration = measurements["wordEnd"] - measurements["wordStart"]
+        comparison["wordDurationVsNativeMs"] = 1000 * float(wordDuration - reference.wordDuration())
+
+    for name in OCCLUSION_MEASUREMENTS:
+        if name in measurements and name in reference.measurements:
+            comparison[name + "VsNativeMs"] = 1000 * float(measurements[name] - reference.measurements[name])
+
+    return comparison
+
+# Add the comparison of record, the measurementLog.AnalysisRecord of a
+# learner's take, with the native reading of its target word to its
+# measurements. Returns the comparison, which is empty if the word has no
+# reference.
+def compareToNative(record, index=REFERENCE_INDEX):
+    reference = index.get(record.target)
+    if reference == None:
+        return {}
+
+    comparison = compareMeasurements(reference, record.measurements)
+    for name, value in comparison.items():
+        record.measure(name, value)
+    return comparison
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze the native speaker recordings once and index their measurements.")
+    parser.add_argument("-o", "--output", default=REFERENCE_INDEX_FILE, help="file to write the index to")
+    parser.add_argument("--model", default=recognition.MODEL_PATH, help="directory of the Vosk model")
+    parser.add_argument("--grammar", action="store_true", help="only recognize the words of each recording's sentence, for takes recognized with CONSTRAIN_RECOGNITION")
+    arguments = parser.parse_args(argv)
+
+    recognition.MODEL_REGISTRY.modelPath = arguments.model
+    missing = buildIndex(arguments.output, arguments.grammar)
+
+    print(f"Indexed {len(TARGET_WORDS) - len(missing)} native speaker recordings in {arguments.output}", file=sys.stderr)
+    for target in missing:
+        print(f"'{target}' wasn't recognized in its recording, so has no reference", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Time each stage of analyzeWord on synthetic words of growing length, from
+# a short word up to minutes of audio, to see how each stage scales. Every
+# length is run with a tap, a trill and no rhotic at all (see
+# syntheticRhotics), which doubles as a check that the detectors still find
+# what was put there.
+#
+#   python scalingBenchmark.py --durations 0.2 1 10 60 --save scaling.json
+
+import argparse
+import json
+import sys
+import tracemalloc
+
+import benchmark
+import isolateSound
+import syntheticRhotics
+
+DURATIONS = [0.2, 0.5, 1, 2, 5, 10, 30, 60, 120]
+KINDS = [isolateSound.TAP, isolateSound.TRILL, isolateSound.OTHER]
+WORD_STAGES = ["spectral band energy", "intensity and minima", "trill detector", "pitch and pulses", "tap detector"]
+
+# Time every stage on each kind of rhotic at one duration, then run them
+# again with memory traced. Only Python and numpy allocations are traced, not
+# Praat's own, so pitch and intensity use more than they show. Returns the
+# median time and peak traced memory of each stage, and what each kind was
+# classified as.
+def benchmarkDuration(duration, repeat, seed):
+    words = [(kind, syntheticRhotics.makeRhotic(kind, duration, seed=seed)[0]) for kind in KINDS]
+
+    timer = benchmark.StageTimer()
+    classified = {}
+    for _ in range(repeat):
+        for kind, samples in words:
+            classified[kind] = benchmark.benchmarkWord(timer, samples, syntheticRhotics.SYNTHETIC_RATE)
+
+    tracemalloc.start()
+    memoryTimer = benchmark.StageTimer(traceMemory=True)
+    for kind, samples in words:
+        benchmark.benchmarkWord(memoryTimer, samples, syntheticRhotics.SYNTHETIC_RATE)
+    tracemalloc.stop()
+
+    stages = {}
+    for stage in WORD_STAGES:
+        seconds = sorted(timer.seconds[stage])
+        if len(seconds) == 0:
+            continue
+        stages[stage] = {"p50": seconds[len(seconds) // 2], "peakTracedBytes": memoryTimer.peakBytes[stage]}
+    return {"duration": duration, "stages": stages, "classified": classified}
+
+def printResults(results):
+    print(f"  {'seconds':>8}  " + "".join(f"{stage:>22}" for stage in WORD_STAGES) + "  classified")
+    for result in results:
+        cells = ""
+        for stage in WORD_STAGES:
+            stats = result["stages"].get(stage)
+            cell = "-"
+            if stats != None:
+                cell = f"{stats['p50'] * 1000:.1f}ms {stats['peakTracedBytes'] / (1024 * 1024):.1f}MB"
+            cells += f"{cell:>22}"
+
+        classified = " ".join(f"{kind}={found}" for kind, found in result["classified"].items())
+        print(f"  {result['duration']:>8}  {cells}  {classified}")
+
+# Return the (duration, kind, classification) of every synthetic word that
+# wasn't classified as the kind of rhotic it was made with.
+def findMisclassified(results):
+    misclassified = []
+    for result in results:
+        for kind, found in result["classified"].items():
+            if found != kind:
+                misclassified.append((result["duration"], kind, found))
+    return misclassified
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Time each analysis stage on synthetic words of growing length.")
+    parser.add_argument("--durations", type=float, nargs="+", default=DURATIONS, help="lengths of word to test, in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each word")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic words")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+
+    results = []
+    for duration in arguments.durations:
+        results.append(benchmarkDuration(duration, arguments.repeat, arguments.seed))
+        print(f"Finished {duration}s", file=sys.stderr)
+
+    printResults(results)
+
+    if arguments.save != None:
+        with open(arguments.save, "w") as saveFile:
+            json.dump({"commit": benchmark.getCommit(), "results": results}, saveFile, indent=2)
+
+    misclassified = findMisclassified(results)
+    for duration, kind, found in misclassified:
+        print(f"A {duration}s synthetic {kind} was classified as {found}")
+    if len(misclassified) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+import re
+
+# The sentences read in the study, the word in each whose 'r' sound is
+# analyzed, and a native speaker's recording of each sentence. Entries at the
+# same index belong together.
+NATIVE_SPEAKER_VOICE_SAMPLES = ["voiceExamples/rec1.wav", "voiceExamples/rec2.wav",
+"voiceExamples/rec3.wav", "voiceExamples/rec4.wav", "voiceExamples/rec5.wav", "voiceExamples/rec6.wav",
+"voiceExamples/rec7.wav", "voiceExamples/rec8.wav", "voiceExamples/rec9.wav", "voiceExamples/rec10.wav",
+"voiceExamples/rec11.wav", "voiceExamples/rec12.wav", "voiceExamples/rec13.wav", "voiceExamples/rec14.wav",
+"voiceExamples/rec15.wav", "voiceExamples/rec16.wav", "voiceExamples/rec17.wav", "voiceExamples/rec18.wav",
+"voiceExamples/rec19.wav", "voiceExamples/rec20.wav"]
+SENTENCE_SAMPLES = ["Tengo muchas comidas para mi familia.",
+"Hay topacio y oro en el anillo.",
+"Hay un zorro muy bonito nadando en la playa.",
+"Todos quisimos un perro como mascota.",
+"Corro dos millas todos los días.",
+"El carro de mi tío es azul y blanco.",
+"Daniel tocaba la guitarra en la banda.",
+"Necesito que la caja sea duro.",
+"La mostaza es un condimento horrible en la pizza.",
+"Hay una gorra azul de tu talla en la mesa.",
+"Quiero lechuga y tomate en mi sándwich.",
+"El toro está comiendo heno.",
+"La mamá mira a su hijo en el tobogán.",
+"Mi gato Felix es muy curioso.",
+"Me gustaba mi tiempo en el coro de mi colegio.",
+"Dibujo algo nuevo en la pizarra cada semana.",
+"Veo una jarra llena de limonada.",
+"El juego fue muy caro así que no fuimos.",
+"La candela tiene un buen aroma.",
+"Veo la cara de una niña en la foto."]
+TARGET_WORDS = ["para", "oro", "zorro", "perro", "corro", "carro", "guitarra", "duro",
+"horrible", "gorra", "quiero", "toro", "mira", "curioso", "coro", "pizarra", "jarra",
+"caro", "aroma", "cara"]
+SENTENCE_FILE_PATTERN = re.compile(r"sentence(\d+)rec\d+\.(wav|flac)$")
+
+# Return the study sentence containing targetWord, or None if it isn't one
+# of the TARGET_WORDS.
+def sentenceForWord(targetWord):
+    if targetWord in TARGET_WORDS:
+        return SENTENCE_SAMPLES[TARGET_WORDS.index(targetWord)]
+    return None
+
+# Return the target word of a recording from its file name, or None if the
+# name isn't one the study uses. Recordings made in the study are named
+# sentence<N>rec<M>.wav after TARGET_WORDS[N], and native speaker recordings
+# keep the names listed in NATIVE_SPEAKER_VOICE_SAMPLES.
+def targetWordForFile(filename):
+    name = os.path.basename(filename)
+
+    match = SENTENCE_FILE_PATTERN.search(name)
+    if match != None and int(match.group(1)) < len(TARGET_WORDS):
+        return TARGET_WORDS[int(match.group(1))]
+
+    for i, sample in enumerate(NATIVE_SPEAKER_VOICE_SAMPLES):
+        if os.path.basename(sample) == name:
+            return TARGET_WORDS[i]
+
+    return None
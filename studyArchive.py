@@ -0,0 +1,146 @@
+# Write the zip archive participants send back as the study goes, and read
+# recordings straight out of it without extracting them to disk.
+
+import io
+import os
+import queue
+import re
+import threading
+import traceback
+import zipfile
+
+import isolateSound
+import sentences
+
+ISOLATED_WORD_PATTERN = re.compile(r"^\w+-only")
+RECORDING_EXTENSIONS = (".wav", ".flac")
+
+# Ways of compressing the archive. PCM audio barely compresses with general
+# purpose codecs, so fast deflate loses little to the much slower lzma the
+# study used to use. "flac" encodes recordings losslessly as FLAC, which needs
+# the soundfile package; without it, deflate is used instead.
+ARCHIVE_CODECS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "lzma": zipfile.ZIP_LZMA,
+    "flac": zipfile.ZIP_STORED, # Recordings are already compressed as FLAC
+}
+DEFLATE_LEVEL = 1 # Higher levels are slower and gain next to nothing on audio
+
+# True if name is a clip of just the target word, saved by the study as
+# <word>-only<recording>.wav, rather than a whole sentence.
+def isIsolatedWord(name):
+    return ISOLATED_WORD_PATTERN.match(os.path.basename(name)) != None
+
+# Return (member name, target word) for every study recording in the
+# archive, in archive order. Other members, like the measurements log, are
+# left out.
+def listRecordings(archivePath):
+    with zipfile.ZipFile(archivePath) as archive:
+        recordings = []
+        for name in archive.namelist():
+            if not name.endswith(RECORDING_EXTENSIONS):
+                continue
+
+            target = sentences.targetWordForFile(name)
+            if target != None:
+                recordings.append((name, target))
+        return recordings
+
+# Decode one recording from the archive into memory. The member is
+# decompressed as it is read, with no temporary file.
+def readRecording(archivePath, memberName):
+    with zipfile.ZipFile(archivePath) as archive:
+        with archive.open(memberName) as member:
+            if memberName.endswith(".flac"):
+                return decodeFlac(member)
+            return isolateSound.readWave(member)
+
+def canEncodeFlac():
+    try:
+        import soundfile
+        return True
+    except ImportError:
+        return False
+
+# Return the mono 16 bit wave file filename encoded as FLAC.
+def encodeFlac(filename):
+    import soundfile
+
+    samples, framerate = isolateSound.readWave(filename)
+    flac = io.BytesIO()
+    soundfile.write(flac, samples, framerate, format="FLAC", subtype="PCM_16")
+    return flac.getvalue()
+
+# Decode FLAC from an open binary file into samples, like readWave.
+def decodeFlac(source):
+    import soundfile
+
+    samples, framerate = soundfile.read(io.BytesIO(source.read()), dtype="int16")
+    if samples.ndim != 1:
+        raise ValueError("audio file must be mono")
+    return samples, framerate
+
+# Builds the study archive while the study is still running. Files are
+# queued with add() as soon as they are final and compressed on a
+# background thread, so closing the archive at the end only waits for the
+# last few files rather than the whole session.
+class ArchiveWriter:
+    def __init__(self, archivePath, codec="deflate"):
+        if codec == "flac" and not canEncodeFlac():
+            codec = "deflate"
+        self.codec = codec
+
+        compresslevel = DEFLATE_LEVEL if codec == "deflate" else None
+        self.archive = zipfile.ZipFile(archivePath, "w", compression=ARCHIVE_CODECS[codec], compresslevel=compresslevel)
+
+        self.files = queue.Queue() # (filename, delete) waiting to be added, then None to close
+        self.onClosed = None # Called on the writing thread once the archive is closed
+        self.closing = False # Set once close() has been called
+
+        self.thread = threading.Thread(target=self.writeFiles, daemon=True)
+        self.thread.start()
+
+    # Queue filename to be added to the archive, and deleted once it is if
+    # delete is True.
+    def add(self, filename, delete=True):
+        self.files.put((filename, delete))
+
+    # Close the archive once the files already queued are added, then call
+    # onClosed. Returns straight away. Calls after the first do nothing.
+    def close(self, onClosed=None):
+        if self.closing:
+            return
+        self.closing = True
+        self.onClosed = onClosed
+        self.files.put(None)
+
+    # Wait up to timeout seconds, or for good if None, for the archive to be
+    # closed. Returns whether it was.
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def writeFiles(self):
+        item = self.files.get()
+        while item != None:
+            filename, delete = item
+            try:
+                self.writeFile(filename)
+                if delete:
+                    os.remove(filename)
+            except Exception:
+                traceback.print_exc()
+
+            item = self.files.get()
+
+        self.archive.close()
+        if self.onClosed != None:
+            self.onClosed()
+
+    def writeFile(self, filename):
+        name = os.path.basename(filename)
+        if self.codec == "flac" and name.endswith(".wav"):
+            self.archive.writestr(name[:-len(".wav")] + ".flac", encodeFlac(filename))
+        else:
+            self.archive.write(filename, name)
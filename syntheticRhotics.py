@@ -0,0 +1,95 @@
+# Generate vowel-occlusion-vowel signals that imitate a rhotic between two
+# vowels, for exercising the detectors in isolateSound on audio of any length.
+# The vowel is built from the harmonics of a slightly wavering pitch, shaped
+# by the formants of /a/. Occlusions keep a little of the voicing, as a real
+# tongue contact does.
+
+import numpy
+
+import isolateSound
+
+SYNTHETIC_RATE = isolateSound.AUDIO_RATE
+FORMANTS = [(700, 90), (1220, 110), (2600, 160)] # (frequency, bandwidth) of an /a/ vowel
+PITCH = 120 # Fundamental frequency in Hz
+RAMP_SECONDS = 0.004 # Length of the fade into and out of each occlusion
+
+# Return the amplitude of harmonics at frequencies, following the combined
+# response of the formant resonances.
+def formantEnvelope(frequencies):
+    envelope = numpy.zeros_like(frequencies)
+    for formant, bandwidth in FORMANTS:
+        envelope += 1 / numpy.sqrt((1 - (frequencies / formant) ** 2) ** 2 + (frequencies * bandwidth / formant ** 2) ** 2)
+    return envelope / numpy.abs(envelope).max()
+
+# Return duration seconds of a sustained vowel, with a peak of amplitude
+# (1 being full scale).
+def makeVowel(duration, framerate=SYNTHETIC_RATE, amplitude=0.3, rng=None):
+    if rng == None:
+        rng = numpy.random.default_rng()
+
+    numSamples = int(duration * framerate)
+
+    # A slow wobble in pitch, integrated into a phase
+    times = numpy.arange(numSamples) / framerate
+    pitch = PITCH * (1 + 0.02 * numpy.sin(2 * numpy.pi * 4 * times + rng.uniform(0, 2 * numpy.pi)))
+    phase = 2 * numpy.pi * numpy.cumsum(pitch) / framerate
+
+    harmonics = numpy.arange(1, int(0.45 * framerate / PITCH))
+    harmonics = harmonics[harmonics * PITCH < 5000]
+    weights = formantEnvelope(harmonics * float(PITCH))
+
+    vowel = numpy.zeros(numSamples)
+    for harmonic, weight in zip(harmonics, weights):
+        vowel += weight * numpy.sin(harmonic * phase)
+
+    return vowel * (amplitude / numpy.abs(vowel).max())
+
+# Return an envelope of numSamples that is 1 except for a dip to level
+# between start and end (in samples), with short cosine ramps at each side.
+def occlusionEnvelope(numSamples, occlusions, level, framerate):
+    envelope = numpy.ones(numSamples)
+    ramp = max(1, int(RAMP_SECONDS * framerate))
+    fade = 0.5 - 0.5 * numpy.cos(numpy.linspace(0, numpy.pi, ramp))
+
+    for start, end in occlusions:
+        start = int(start * framerate)
+        end = int(end * framerate)
+        envelope[start:end] = level
+        envelope[max(0, start - ramp):start] = 1 - (1 - level) * fade[ramp - min(ramp, start):]
+        envelope[end:end + ramp] = level + (1 - level) * fade[:len(envelope[end:end + ramp])]
+    return envelope
+
+# Return the (start, end) times of each occlusion in a rhotic of kind TAP,
+# TRILL or OTHER, centred on centre.
+def occlusionTimes(kind, centre, occlusionLength=0.025, contacts=3, gapLength=0.025):
+    if kind == isolateSound.TAP:
+        return [(centre - occlusionLength / 2, centre + occlusionLength / 2)]
+    elif kind == isolateSound.TRILL:
+        period = occlusionLength + gapLength
+        first = centre - (contacts * period - gapLength) / 2
+        return [(first + i * period, first + i * period + occlusionLength) for i in range(contacts)]
+    else:
+        return []
+
+# Generate duration seconds of vowel with one rhotic of kind TAP, TRILL or
+# OTHER (no occlusion) in the middle, as 16 bit samples. noise is the level of
+# white noise added, relative to the vowel's amplitude. Returns the samples
+# and the (start, end) times of the occlusions.
+def makeRhotic(kind, duration=0.3, framerate=SYNTHETIC_RATE, occlusionLength=0.025, contacts=3,
+        gapLength=0.025, occlusionLevel=0.1, noise=0.005, seed=None):
+    rng = numpy.random.default_rng(seed)
+
+    vowel = makeVowel(duration, framerate, rng=rng)
+    occlusions = occlusionTimes(kind, duration / 2, occlusionLength, contacts, gapLength)
+    signal = vowel * occlusionEnvelope(len(vowel), occlusions, occlusionLevel, framerate)
+
+    # Fade the word in and out like a spoken word, rather than cutting it
+    edge = min(len(signal) // 4, int(0.03 * framerate))
+    if edge > 0:
+        signal[:edge] *= numpy.linspace(0, 1, edge)
+        signal[len(signal) - edge:] *= numpy.linspace(1, 0, edge)
+
+    signal += rng.normal(0, noise * 0.3, len(signal))
+
+    samples = numpy.clip(numpy.round(signal * 32767), -32768, 32767).astype(numpy.int16)
+    return samples, occlusions
@@ -0,0 +1,125 @@
+# Checks the on-disk analysis cache: that tracks survive being stored, that
+# entries are only found again by the code and parameters that made them,
+# that the least recently read entries are evicted first to keep the cache
+# under its size, and that hits and misses are counted.
+#
+#   python -m pytest test_analysisCache.py
+
+import os
+
+import numpy
+
+import analysisCache
+import isolateSound
+import recognition
+import tracks
+
+ENTRY_BYTES = 100 # Size of each entry written by the eviction tests
+
+def getSamples(seed):
+    return numpy.random.default_rng(seed).integers(-3000, 3000, 4000).astype(numpy.int16)
+
+# Write an entry of ENTRY_BYTES with its last use set to lastUsed, in seconds
+# since the epoch, so the order of use doesn't depend on the clock.
+def writeEntry(cache, key, lastUsed):
+    cache.write("words", key, b"x" * ENTRY_BYTES)
+    os.utime(cache.getPath("words", key), (lastUsed, lastUsed))
+
+def testFeaturesRoundTrip():
+    features = {
+        "spectralTrack": tracks.SpectralTrack([1.5, 2.5, 3.5], [0.0, 0.002, 0.004], 0.002),
+        "intensityTrack": tracks.IntensityTrack([60.0, 58.25], [0.1, 0.3]),
+        "pulseTimes": numpy.array([0.01, 0.02, 0.035]),
+    }
+    unpacked = analysisCache.unpackFeatures(analysisCache.packFeatures(features))
+
+    assert sorted(unpacked) == sorted(features)
+    for name in ("spectralTrack", "intensityTrack"):
+        assert type(unpacked[name]) == type(features[name])
+        assert unpacked[name].values.tolist() == features[name].values.tolist()
+        assert unpacked[name].times.tolist() == features[name].times.tolist()
+        assert unpacked[name].step == features[name].step
+    assert unpacked["pulseTimes"].tolist() == features["pulseTimes"].tolist()
+
+def testFeaturesFoundAgain(tmp_path):
+    samples = getSamples(0)
+    cache = analysisCache.AnalysisCache(str(tmp_path))
+
+    features = cache.getFeatures(samples, 44100)
+    assert len(features) == 0
+    features["intensityTrack"] = tracks.IntensityTrack([60.0, 58.25], [0.1, 0.3], 0.2)
+    features["pitch"] = object() # Praat objects aren't stored
+    cache.putFeatures(features)
+
+    found = analysisCache.AnalysisCache(str(tmp_path)).getFeatures(samples, 44100)
+    assert sorted(found) == ["intensityTrack"]
+    assert found["intensityTrack"].values.tolist() == [60.0, 58.25]
+
+    assert len(cache.getFeatures(getSamples(1), 44100)) == 0
+    assert len(cache.getFeatures(samples, 16000)) == 0
+
+def testFeaturesFingerprintChangesWithParameters(tmp_path, monkeypatch):
+    samples = getSamples(0)
+    cache = analysisCache.AnalysisCache(str(tmp_path))
+    features = cache.getFeatures(samples, 44100)
+    features["pulseTimes"] = numpy.array([0.01, 0.02])
+    cache.putFeatures(features)
+
+    monkeypatch.setattr(isolateSound, "INTENSITY_TIME_STEP", isolateSound.INTENSITY_TIME_STEP / 2)
+    assert len(analysisCache.AnalysisCache(str(tmp_path)).getFeatures(samples, 44100)) == 0
+
+def testWordsFingerprintChangesWithModel(tmp_path, monkeypatch):
+    samples = getSamples(0)
+    words = [{"word": "perro", "start": 0.1, "end": 0.4, "conf": 1.0}]
+    cache = analysisCache.AnalysisCache(str(tmp_path))
+    cache.putWords(samples, 44100, "perro", None, words)
+
+    assert cache.getWords(samples, 44100, "Perro") == words
+    assert cache.getWords(samples, 44100, "perro", grammar='["perro", "[unk]"]') == None
+
+    monkeypatch.setattr(recognition.MODEL_REGISTRY, "modelPath", "another-model")
+    assert cache.getWords(samples, 44100, "perro") == None
+
+def testLeastRecentlyReadEvictedFirst(tmp_path):
+    cache = analysisCache.AnalysisCache(str(tmp_path), maxBytes=int(3.5 * ENTRY_BYTES))
+    writeEntry(cache, "aa", 1000)
+    writeEntry(cache, "bb", 2000)
+    writeEntry(cache, "cc", 3000)
+
+    # Reading the oldest makes it the most recently used, so the next oldest goes
+    assert cache.read("words", "aa") != None
+    cache.write("words", "dd", b"x" * ENTRY_BYTES)
+
+    assert cache.read("words", "bb") == None
+    for key in ("aa", "cc", "dd"):
+        assert cache.read("words", key) != None
+    assert cache.stats()["evicted"] == 1
+
+def testSizeBound(tmp_path):
+    maxBytes = 10 * ENTRY_BYTES
+    cache = analysisCache.AnalysisCache(str(tmp_path), maxBytes=maxBytes)
+    for i in range(50):
+        writeEntry(cache, f"{i:04d}", 1000 + i)
+
+        sizes = [os.path.getsize(os.path.join(root, filename)) for root, _, filenames in os.walk(str(tmp_path)) for filename in filenames]
+        assert sum(sizes) <= maxBytes
+
+    # The newest entries are the ones kept
+    assert cache.read("words", "0049") != None
+    assert cache.read("words", "0000") == None
+
+def testStatsCountedAndTaken(tmp_path):
+    samples = getSamples(0)
+    cache = analysisCache.AnalysisCache(str(tmp_path))
+
+    assert cache.getWords(samples, 44100, "perro") == None
+    cache.putWords(samples, 44100, "perro", None, [])
+    assert cache.getWords(samples, 44100, "perro") == []
+    cache.getFeatures(samples, 44100)
+
+    assert cache.takeStats() == {"wordsHits": 1, "wordsMisses": 1, "featuresHits": 0, "featuresMisses": 1, "evicted": 0}
+    assert cache.stats() == dict.fromkeys(analysisCache.STAT_NAMES, 0)
+
+    total = analysisCache.addStats({}, {"wordsHits": 2, "evicted": 1})
+    analysisCache.addStats(total, {"wordsHits": 3})
+    assert total["wordsHits"] == 5 and total["evicted"] == 1 and total["featuresMisses"] == 0
@@ -0,0 +1,73 @@
+# Checks that a new job cancels the unfinished job of its group without
+# touching other groups, and that whenIdle waits for every job.
+#
+#   python -m pytest test_analysisPool.py
+
+import threading
+
+import analysisPool
+
+TIMEOUT = 5 # Seconds a test waits for the pool before failing
+
+# A job function that blocks until release is set, recording whether its job
+# had been cancelled by then.
+def blockUntil(job, release, started, seenCancelled):
+    started.set()
+    release.wait(TIMEOUT)
+    seenCancelled.append(job.isCancelled())
+    return "blocked"
+
+def returnValue(job, value):
+    return value
+
+def testNewJobCancelsOnlyItsGroup():
+    pool = analysisPool.AnalysisPool(workers=2)
+    release, started = threading.Event(), threading.Event()
+    seenCancelled, done, idle = [], [], []
+    idleEvent = threading.Event()
+
+    def onDone(job, result):
+        done.append(result)
+
+    first = pool.submit("label", blockUntil, release, started, seenCancelled, onDone=onDone)
+    assert started.wait(TIMEOUT)
+    second = pool.submit("label", returnValue, "second", onDone=onDone)
+    other = pool.submit("other label", returnValue, "other", onDone=onDone)
+    pool.whenIdle(lambda: (idle.append(True), idleEvent.set()))
+
+    release.set()
+    assert idleEvent.wait(TIMEOUT)
+    pool.shutdown()
+
+    assert first.isCancelled()
+    assert not second.isCancelled() and not other.isCancelled()
+    assert seenCancelled == [True]
+    assert sorted(done) == ["other", "second"]
+    assert idle == [True]
+    assert pool.current == {}
+
+def testJobCancelledWhileQueuedStillRuns():
+    pool = analysisPool.AnalysisPool(workers=1)
+    release, started = threading.Event(), threading.Event()
+    seenCancelled, done = [], []
+
+    pool.submit("busy", blockUntil, release, started, [])
+    assert started.wait(TIMEOUT)
+    released = threading.Event()
+    released.set()
+    queued = pool.submit("label", blockUntil, released, threading.Event(), seenCancelled, onDone=lambda job, result: done.append(result))
+    pool.cancel("label")
+
+    release.set()
+    pool.shutdown()
+
+    # It was called, to release what it holds, but saw it was cancelled and gave no result
+    assert queued.isCancelled()
+    assert seenCancelled == [True]
+    assert done == []
+
+def testWhenIdleWithNothingQueued():
+    pool = analysisPool.AnalysisPool(workers=1)
+    idle = []
+    pool.whenIdle(lambda: idle.append(True))
+    assert idle == [True]
@@ -0,0 +1,247 @@
+# Checks that the array implementations in isolateSound give the same
+# results as the loops they replaced, on clips cut from the native speaker
+# recordings in voiceExamples. The loops are kept here as they were before
+# being replaced, working on lists of (value, time) tuples.
+#
+#   python -m pytest test_isolateSound.py
+
+import io
+import re
+from math import trunc
+
+import parselmouth
+import pytest
+
+import isolateSound
+import tracks
+from sentences import NATIVE_SPEAKER_VOICE_SAMPLES
+
+SPECTRAL_TOLERANCE = 1e-12 # Relative difference allowed between the band energies of the two versions
+CLIP_WINDOWS = [(0.3, 0.5), (0.8, 0.4), (1.2, 0.6), (0.5, 1.0), (0.0, 2.0)] # (start, length) in seconds of the clips cut from each recording
+
+# Every clip as (name, sound), read once for all the tests.
+@pytest.fixture(scope="module")
+def clips():
+    clips = []
+    for filename in NATIVE_SPEAKER_VOICE_SAMPLES:
+        samples, framerate = isolateSound.readWave(filename)
+        for start, length in CLIP_WINDOWS:
+            first = int(start * framerate)
+            clipSamples = samples[first:first + int(length * framerate)]
+            clips.append((f"{filename}@{start}s", isolateSound.toSound(clipSamples, framerate)))
+    return clips
+
+# Run function(*args), giving the name of the exception instead of a result
+# if it raises one, as both versions give up on some clips the same way.
+def outcome(function, *args):
+    try:
+        return function(*args)
+    except Exception as error:
+        return type(error).__name__
+
+# Notes written by an analysis, with numpy scalars written as plain floats
+# so the lists and arrays versions compare equal.
+def getNotes(logger):
+    return re.sub(r"np\.float64\(([^)]*)\)", r"\1", logger.getvalue())
+
+def getDurationList(sound):
+    intensity = sound.to_intensity(time_step=0.0005)
+    times = intensity.xs()
+    intensities = intensity.values.T
+    return [(intensities[i][0], times[i]) for i in range(len(times))]
+
+def baselineFindAllLocalMinima(durationList):
+    minima = []
+
+    for i in range(16, len(durationList) - 16):
+        if durationList[i][0] < durationList[i-1][0] and durationList[i][0] < durationList[i+1][0]:
+            if ((((durationList[i - 20][0] - durationList[i][0]) + (durationList[i + 20][0] - durationList[i][0])) / 2) > 0.6
+                and durationList[i - 8][0] > durationList[i][0] and durationList[i + 8][0] > durationList[i][0]):
+                minima.append(durationList[i])
+
+    return minima
+
+def baselineCheckForTrill(minima, spectralPowerList, logger):
+    for i in range(len(minima) - 1):
+        if minima[i+1][1] - minima[i][1] < .06:
+            indexIntoSpectralList1 = trunc((minima[i][1] - spectralPowerList[0][1]) / 0.002)
+            spectralPowerTally1 = 0
+            for j in range(5):
+                spectralPowerTally1 += spectralPowerList[indexIntoSpectralList1 - 2 + j][0]
+            spectralPowerTally1 /= 5
+
+            indexIntoSpectralList2 = trunc((minima[i+1][1] - spectralPowerList[0][1]) / 0.002)
+            spectralPowerTally2 = 0
+            for j in range(5):
+                spectralPowerTally2 += spectralPowerList[indexIntoSpectralList2 - 2 + j][0]
+            spectralPowerTally2 /= 5
+
+            indexIntoSpectralList3 = (indexIntoSpectralList1 + indexIntoSpectralList2) // 2
+            spectralPowerTally3 = 0
+            for j in range(5):
+                spectralPowerTally3 += spectralPowerList[indexIntoSpectralList3 - 2 + j][0]
+            spectralPowerTally3 /= 5
+
+            if ((spectralPowerTally1 + spectralPowerTally2) / 2) < (spectralPowerTally3 / 2):
+                if logger != None:
+                    logger.write("trill found\n")
+                    logger.write(f"first occlusions: {minima[i][1]}, {minima[i+1][1]}" + "\n")
+                return isolateSound.TRILL
+
+    return None
+
+def baselineGetSpectralPowerList(sound, duration):
+    spectralPowerList = []
+    spectrogram = sound.to_spectrogram()
+
+    i = 0
+    while i < duration:
+        power = spectrogram.to_spectrum_slice(i).get_band_energy()
+        spectralPowerList.append((power, i))
+
+        i += 0.002
+
+    return spectralPowerList
+
+def baselineTrimSpectralPowerList(spectralPowerList):
+    # Omit initial silence
+    for i, cur in enumerate(spectralPowerList):
+        if cur[0] > 20:
+            break
+    trimmedList = spectralPowerList[i:]
+
+    # Now omit end silence
+    for i in range(len(trimmedList)-1, 0, -1):
+        if trimmedList[i][0] > 20:
+            break
+    trimmedList = trimmedList[:i]
+
+    return trimmedList
+
+# The whole analysis as it was, taking a sound rather than a file name.
+def baselineAnalyzeWord(sound, logger=None):
+    duration = sound.get_total_duration()
+
+    spectralPowerList = baselineGetSpectralPowerList(sound, duration)
+
+    # Omit initial and end silence to get better average
+    # This will help calibrate occlusion threshhold
+    spectralPowerList = baselineTrimSpectralPowerList(spectralPowerList)
+
+    # spectralPowerList average
+    average = sum([row[0] for row in spectralPowerList]) / len(spectralPowerList)
+
+    durationList = getDurationList(sound)
+
+    minima = baselineFindAllLocalMinima(durationList)
+
+    trillFound = baselineCheckForTrill(minima, spectralPowerList, logger)
+    if trillFound == isolateSound.TRILL:
+        return isolateSound.TRILL
+
+    pitch = sound.to_pitch()
+    pulses = parselmouth.praat.call([sound, pitch], "To PointProcess (cc)")
+    numPulses = parselmouth.praat.call(pulses, "Get number of points")
+    pulseList = []
+    for pulseIndex in range(1, numPulses+1):
+        pulseList.append(parselmouth.praat.call(pulses, "Get time from index", pulseIndex))
+
+    # Check for tap
+    tapsFound = 0
+    i = 0
+    j = 0
+    numFalseOutliers = 0
+    min = None
+    tapStart = None
+    tapEnd = None
+    while i < len(spectralPowerList):
+        if spectralPowerList[i][0] < (average / 2.5):
+            sharpOutlier = False
+            outliers = 0
+            j = 0
+            while i < len(spectralPowerList) and j < 25 and outliers < 6:
+                if spectralPowerList[i][0] > (average / 2.5) and spectralPowerList[i][0] < (average / 1.3):
+                    outliers += 1
+                elif spectralPowerList[i][0] > (average / 1.3):
+                    if sharpOutlier:
+                        break
+                    sharpOutlier = True
+                i += 1
+                j += 1
+
+            # Do not count 'outliers' that came at the occlusion. Outliers are
+            # only sound in the middle of the occlusion
+            numFalseOutliers = 0
+            for k in range(outliers):
+                if spectralPowerList[i-1-k][0] < (average / 2.5):
+                    j -= 1
+                    numFalseOutliers += 1
+
+            if j <= 30 and j >= 8:
+                numPulsesInRange = 0
+                for k in pulseList:
+                    if k > spectralPowerList[i-j-numFalseOutliers][1] and k < spectralPowerList[i-numFalseOutliers][1]:
+                        numPulsesInRange += 1
+
+                if numPulsesInRange >= j//10:
+                    for min in minima:
+                        if min[1] < spectralPowerList[i-numFalseOutliers][1] and min[1] > spectralPowerList[i-j-numFalseOutliers][1]:
+                            tapStart = spectralPowerList[i-j-numFalseOutliers][1]
+                            tapEnd = spectralPowerList[i-numFalseOutliers][1]
+                            tapsFound += 1
+                            break
+        i += 1
+
+    if tapsFound == 1:
+        if logger != None:
+            logger.write("tap found\n")
+            logger.write(f"occlusion minima: {min}\n")
+            logger.write(f"occlusion length: {j*0.002}\n")
+            logger.write(f"occlusion midpoint: {(tapStart + tapEnd) / 2}\n")
+        return isolateSound.TAP
+    else:
+        if logger != None:
+            logger.write("no tap or trill found \n")
+        return isolateSound.OTHER
+
+def testLocalMinimaMatchBaseline(clips):
+    for name, sound in clips:
+        durationList = getDurationList(sound)
+        intensityTrack = tracks.IntensityTrack.fromIntensity(sound.to_intensity(time_step=0.0005))
+
+        expected = outcome(baselineFindAllLocalMinima, durationList)
+        minima = outcome(isolateSound.findAllLocalMinima, intensityTrack)
+        if isinstance(minima, tracks.Track):
+            minima = list(minima)
+        assert minima == expected, name
+
+def testTrillMatchesBaseline(clips):
+    for name, sound in clips:
+        spectralTrack = isolateSound.trimSpectralPowerList(isolateSound.getSpectralPowerList(sound, sound.get_total_duration()))
+        intensityTrack = tracks.IntensityTrack.fromIntensity(sound.to_intensity(time_step=0.0005))
+        minima = outcome(isolateSound.findAllLocalMinima, intensityTrack)
+        if not isinstance(minima, tracks.Track):
+            continue
+
+        expectedLog = io.StringIO()
+        expected = outcome(baselineCheckForTrill, list(minima), list(spectralTrack), expectedLog)
+        log = io.StringIO()
+        result = outcome(isolateSound.checkForTrill, minima, spectralTrack, log)
+        assert (result, getNotes(log)) == (expected, getNotes(expectedLog)), name
+
+def testSpectralPowerMatchesBaseline(clips):
+    for name, sound in clips:
+        duration = sound.get_total_duration()
+        expected = baselineGetSpectralPowerList(sound, duration)
+        spectralTrack = isolateSound.getSpectralPowerList(sound, duration)
+
+        assert spectralTrack.times.tolist() == [time for power, time in expected], name
+        assert spectralTrack.values == pytest.approx([power for power, time in expected], rel=SPECTRAL_TOLERANCE), name
+
+def testAnalyzeWordMatchesBaseline(clips):
+    for name, sound in clips:
+        expectedLog = io.StringIO()
+        expected = outcome(baselineAnalyzeWord, sound, expectedLog)
+        log = io.StringIO()
+        result = outcome(isolateSound.analyzeWord, sound, log)
+        assert (result, getNotes(log)) == (expected, getNotes(expectedLog)), name
@@ -0,0 +1,54 @@
+# Checks that MeasurementLog writes out held records in full batches, after
+# BATCH_SECONDS and on close, and that they read back.
+#
+#   python -m pytest test_measurementLog.py
+
+import time
+
+import measurementLog
+
+TIMEOUT = 5 # Seconds a test waits for the timer before failing
+
+def makeRecord(i):
+    record = measurementLog.AnalysisRecord(f"sentence{i}rec1.wav", "perro")
+    record.measure("wordStart", 0.5)
+    record.setResult("trill")
+    return record
+
+def readFiles(path):
+    return [record["file"] for record in measurementLog.readMeasurements(str(path))]
+
+def testBatchWrittenWhenFull(tmp_path):
+    path = tmp_path / "log.jsonl"
+    log = measurementLog.MeasurementLog(str(path), batchSize=3, batchSeconds=60)
+
+    for i in range(2):
+        log.write(makeRecord(i))
+    assert readFiles(path) == []
+
+    log.write(makeRecord(2))
+    assert readFiles(path) == ["sentence0rec1.wav", "sentence1rec1.wav", "sentence2rec1.wav"]
+    log.close()
+
+def testLoneRecordWrittenByTimer(tmp_path):
+    path = tmp_path / "log.jsonl"
+    log = measurementLog.MeasurementLog(str(path), batchSize=8, batchSeconds=0.05)
+    log.write(makeRecord(0))
+
+    deadline = time.time() + TIMEOUT
+    while readFiles(path) == [] and time.time() < deadline:
+        time.sleep(0.01)
+    assert readFiles(path) == ["sentence0rec1.wav"]
+    log.close()
+
+def testCloseWritesHeldRecords(tmp_path):
+    path = tmp_path / "log.jsonl"
+    log = measurementLog.MeasurementLog(str(path), batchSize=8, batchSeconds=60)
+    log.write(makeRecord(0))
+    log.close()
+    log.close()
+
+    records = list(measurementLog.readMeasurements(str(path)))
+    assert [record["file"] for record in records] == ["sentence0rec1.wav"]
+    assert records[0]["measurements"] == {"wordStart": 0.5}
+    assert log.timer == None
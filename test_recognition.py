@@ -0,0 +1,47 @@
+# Checks the Resampler that converts captured audio to the recognizer's rate,
+# which doesn't need the speech model.
+#
+#   python -m pytest test_recognition.py
+
+import numpy
+
+import recognition
+
+INPUT_RATE = 44100
+
+def getSamples(seconds, seed=0):
+    rng = numpy.random.default_rng(seed)
+    times = numpy.arange(int(seconds * INPUT_RATE)) / INPUT_RATE
+    tone = 8000 * numpy.sin(2 * numpy.pi * 440 * times)
+    return numpy.round(tone + rng.normal(0, 500, len(times))).astype(numpy.int16)
+
+def resample(samples, chunkFrames):
+    resampler = recognition.Resampler(INPUT_RATE, recognition.RECOGNIZER_RATE)
+    output = b""
+    for start in range(0, len(samples), chunkFrames):
+        output += resampler.process(samples[start:start + chunkFrames].tobytes())
+    return output
+
+# Output sample k is always taken at time k / outputRate, so how the audio is
+# split into chunks mustn't change it.
+def testResamplerIndependentOfChunkSize():
+    samples = getSamples(0.25)
+    whole = resample(samples, len(samples))
+
+    for chunkFrames in (1, 7, 160, 1024, 4000):
+        assert resample(samples, chunkFrames) == whole, chunkFrames
+
+def testResamplerKeepsTone():
+    samples = getSamples(1.0)
+    output = numpy.frombuffer(resample(samples, 1024), dtype=numpy.int16).astype(float)
+
+    # Every output sample up to the filter's delay from the end is produced
+    delay = (recognition.RESAMPLER_TAPS - 1) / 2 / INPUT_RATE
+    assert abs(len(output) - (1.0 - delay) * recognition.RECOGNIZER_RATE) <= 1
+
+    # The 440 Hz tone comes through at its own frequency and level
+    times = numpy.arange(len(output)) / recognition.RECOGNIZER_RATE
+    sine = numpy.sin(2 * numpy.pi * 440 * (times - delay))
+    cosine = numpy.cos(2 * numpy.pi * 440 * (times - delay))
+    amplitude = 2 * numpy.hypot(numpy.mean(output * sine), numpy.mean(output * cosine))
+    assert abs(amplitude - 8000) < 200
@@ -0,0 +1,62 @@
+# Checks that SpeechTrimmer keeps the speech of a take, padded either side
+# and with its pauses, and keeps a take with no speech whole.
+#
+#   python -m pytest test_voiceActivity.py
+
+import numpy
+import pytest
+
+import voiceActivity
+
+RATE = 16000
+CHUNK_FRAMES = 800 # 50ms, as long as SPEECH_ONSET_SECONDS
+
+# The parts of audioEngine.CaptureBuffer a SpeechTrimmer reads, holding a
+# take that has already been captured.
+class Capture:
+    def __init__(self, samples):
+        self.rate = RATE
+        self.data = bytearray(samples.astype(numpy.int16).tobytes())
+
+    def samples(self):
+        return numpy.frombuffer(self.data, dtype=numpy.int16)
+
+def getSilence(seconds, rng):
+    return rng.normal(0, 30, int(seconds * RATE)) # About -60 dB of full scale
+
+def getSpeech(seconds):
+    times = numpy.arange(int(seconds * RATE)) / RATE
+    return 8000 * numpy.sin(2 * numpy.pi * 220 * times)
+
+# Feed the take to a trimmer chunk by chunk, returning the trimmer and all the
+# audio it kept.
+def trim(samples):
+    capture = Capture(samples)
+    trimmer = voiceActivity.SpeechTrimmer(capture)
+
+    kept = b""
+    for start in range(0, len(capture.data), CHUNK_FRAMES * voiceActivity.SAMPLE_BYTES):
+        kept += trimmer.accept(bytes(capture.data[start:start + CHUNK_FRAMES * voiceActivity.SAMPLE_BYTES]))
+    kept += trimmer.finish()
+    return trimmer, capture, kept
+
+def testSpeechKeptWithPaddingAndPauses():
+    rng = numpy.random.default_rng(0)
+    take = numpy.concatenate((getSilence(1.0, rng), getSpeech(0.5), getSilence(0.4, rng), getSpeech(0.5), getSilence(1.0, rng)))
+    trimmer, capture, kept = trim(take)
+
+    assert trimmer.startSeconds() == pytest.approx(1.0 - voiceActivity.VAD_PAD_SECONDS)
+    assert trimmer.endSeconds() == pytest.approx(2.4 + voiceActivity.VAD_PAD_SECONDS)
+
+    # The pause between the two bursts of speech is kept along with them
+    expected = capture.samples()[int(0.7 * RATE):int(2.7 * RATE)]
+    assert trimmer.samples().tolist() == expected.tolist()
+    assert kept == expected.tobytes()
+
+def testTakeWithoutSpeechKeptWhole():
+    rng = numpy.random.default_rng(1)
+    trimmer, capture, kept = trim(getSilence(2.0, rng))
+
+    assert trimmer.startSeconds() == 0
+    assert trimmer.endSeconds() == 2.0
+    assert kept == bytes(capture.data)
@@ -0,0 +1,47 @@
+import numpy
+
+# A measurement sampled over time, held as two contiguous arrays instead of
+# a list of (value, time) tuples. Tracks sampled on a regular grid also keep
+# their time step, so a time can be turned into a frame index directly.
+class Track:
+    def __init__(self, values, times, step=None):
+        self.values = numpy.ascontiguousarray(values, dtype=float)
+        self.times = numpy.ascontiguousarray(times, dtype=float)
+        self.step = step # Seconds between frames, or None if the times are irregular
+
+    def __len__(self):
+        return len(self.values)
+
+    # Integers give a (value, time) pair, like an entry of the old lists.
+    # Slices give a track that shares memory with this one; index arrays and
+    # masks give a (copied) track of just those frames.
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            step = self.step
+            if step != None and key.step not in (None, 1):
+                step = step * key.step
+            return type(self)(self.values[key], self.times[key], step)
+        elif isinstance(key, (int, numpy.integer)):
+            return (float(self.values[key]), float(self.times[key]))
+        else:
+            return type(self)(self.values[key], self.times[key], None)
+
+    def __iter__(self):
+        return zip(self.values.tolist(), self.times.tolist())
+
+    # Index of the frame at or before each of times, counted from the start
+    # of the track. Only meaningful for tracks on a regular grid.
+    def framesAt(self, times):
+        return numpy.trunc((numpy.asarray(times) - self.times[0]) / self.step).astype(int)
+
+# Spectral band energy, one frame every SPECTRAL_TIME_STEP seconds.
+class SpectralTrack(Track):
+    pass
+
+# Intensity in dB as measured by Praat.
+class IntensityTrack(Track):
+    # Build a track from a parselmouth.Intensity object without copying
+    # its values frame by frame.
+    @staticmethod
+    def fromIntensity(intensity):
+        return IntensityTrack(intensity.values[0], intensity.xs(), intensity.dx)
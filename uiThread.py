@@ -0,0 +1,43 @@
+# Tk only allows widgets to be touched from the thread running the main
+# loop. Background threads (recording, playback, analysis) hand their widget
+# updates to UI.call(), which queues them and wakes the main loop with a
+# virtual event to run them.
+
+import queue
+import traceback
+
+UI_CALL_EVENT = "<<UiCall>>" # Virtual event telling the main loop calls are waiting
+
+class UiDispatcher:
+    def __init__(self):
+        self.root = None
+        self.calls = queue.Queue() # (function, args, kwargs) waiting to run on the main loop
+
+    # Must be called from the thread that will run the main loop.
+    def attach(self, root):
+        self.root = root
+        root.bind(UI_CALL_EVENT, self.runCalls)
+
+    # Run function(*args, **kwargs) on the main loop's thread. Until attach()
+    # is called, it is run straight away instead.
+    def call(self, function, *args, **kwargs):
+        if self.root == None:
+            function(*args, **kwargs)
+            return
+
+        self.calls.put((function, args, kwargs))
+        self.root.event_generate(UI_CALL_EVENT, when="tail")
+
+    def runCalls(self, event=None):
+        while True:
+            try:
+                function, args, kwargs = self.calls.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                function(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+
+UI = UiDispatcher()
@@ -0,0 +1,110 @@
+# Energy based voice activity detection on a take as it is captured.
+# Participants leave silence before and after each sentence, which would
+# otherwise be recognized, analyzed, saved and archived along with the
+# speech. A SpeechTrimmer is handed each captured chunk in turn and passes
+# on only the speech region, padded either side, e.g.
+#
+#   trimmer = voiceActivity.SpeechTrimmer(capture)
+#   for chunk in chunks:
+#       writeFile.writeframesraw(trimmer.accept(chunk))
+#   writeFile.writeframesraw(trimmer.finish())
+#
+# A chunk is speech if it is loud enough above the quietest chunk of the take
+# so far. Pauses within the speech are kept, so words keep their timing.
+
+import numpy
+
+SAMPLE_BYTES = 2 # Bytes in one 16 bit mono frame
+VAD_PAD_SECONDS = 0.3 # Audio kept before the speech starts and after it ends
+SPEECH_MARGIN_DB = 12 # How far above the noise floor a chunk must be to be speech
+NOISE_FLOOR_DB = -45 # Noise floor assumed, in dB of full scale, until a quieter chunk is captured
+DIGITAL_SILENCE_DB = -70 # Chunks this quiet, like the ones a device gives as it starts, don't lower the noise floor
+SPEECH_ONSET_SECONDS = 0.05 # Speech must last this long to start the region, so clicks don't
+
+# Return the level of a chunk of 16 bit audio in dB of full scale.
+def chunkLevel(chunk):
+    samples = numpy.frombuffer(chunk, dtype=numpy.int16).astype(numpy.float64)
+    if len(samples) == 0:
+        return DIGITAL_SILENCE_DB
+    power = numpy.mean(samples * samples) / (32768.0 * 32768.0)
+    return max(10 * numpy.log10(max(power, 1e-12)), DIGITAL_SILENCE_DB)
+
+# Finds the speech in a take captured into capture, an
+# audioEngine.CaptureBuffer, from the chunks it is given in the order they
+# were captured. accept() and finish() return the audio to keep, so it can be
+# written and recognized while the take is still going. A take with no speech
+# found in it is kept whole.
+class SpeechTrimmer:
+    def __init__(self, capture, padSeconds=VAD_PAD_SECONDS, marginDb=SPEECH_MARGIN_DB, onsetSeconds=SPEECH_ONSET_SECONDS):
+        self.capture = capture
+        self.padBytes = int(capture.rate * padSeconds) * SAMPLE_BYTES
+        self.onsetBytes = int(capture.rate * onsetSeconds) * SAMPLE_BYTES
+        self.marginDb = marginDb
+        self.noiseFloor = NOISE_FLOOR_DB # dB of full scale
+
+        self.position = 0 # Bytes of the take accepted so far
+        self.onset = None # Where the run of speech chunks before the region starts began
+        self.start = None # Where the kept region starts, once speech is found
+        self.speechEnd = None # Where the last speech chunk ended
+        self.end = None # Where the kept region ends, once finished
+        self.released = 0 # Where the audio returned so far ends
+
+    # Take the next chunk of the take and return the audio that is now known
+    # to be kept, which may be none.
+    def accept(self, chunk):
+        chunkStart = self.position
+        self.position += len(chunk)
+
+        level = chunkLevel(chunk)
+        if level > DIGITAL_SILENCE_DB:
+            self.noiseFloor = min(self.noiseFloor, level)
+        isSpeech = level >= self.noiseFloor + self.marginDb
+
+        if self.start == None:
+            if not isSpeech:
+                self.onset = None
+                return b""
+
+            if self.onset == None:
+                self.onset = chunkStart
+            if self.position - self.onset < self.onsetBytes:
+                return b""
+
+            self.start = max(self.onset - self.padBytes, 0)
+            self.released = self.start
+
+        if isSpeech:
+            self.speechEnd = self.position
+
+        # Silence within the padding is kept whatever follows; silence past
+        # it is held back until it's known whether speech resumes
+        return self.release(min(self.position, self.speechEnd + self.padBytes))
+
+    # Call once the take has ended. Returns the rest of the audio to keep.
+    def finish(self):
+        if self.start == None:
+            self.start = 0
+            self.end = self.position
+        else:
+            self.end = min(self.position, self.speechEnd + self.padBytes)
+        return self.release(self.end)
+
+    def release(self, end):
+        if end <= self.released:
+            return b""
+
+        data = bytes(self.capture.data[self.released:end])
+        self.released = end
+        return data
+
+    # The kept region as an array that shares the capture's memory. Call
+    # after finish().
+    def samples(self):
+        return self.capture.samples()[self.start // SAMPLE_BYTES:self.end // SAMPLE_BYTES]
+
+    # Where the kept region starts and ends in the take, in seconds.
+    def startSeconds(self):
+        return self.start / SAMPLE_BYTES / self.capture.rate
+
+    def endSeconds(self):
+        return self.end / SAMPLE_BYTES / self.capture.rate